@@ -7,6 +7,7 @@ import numpy as np
 import torch
 import os
 import cv2
+from functools import lru_cache
 
 
 
@@ -117,9 +118,18 @@ def sample_indices(length, target_length, augment=False):
     return indices
 
 
-def process_keypoints(keypoints, target_length, selected_keypoints, augment=False, height=480, width=640, flipped_keypoints=None):
+@lru_cache(maxsize=1)
+def get_selected_keypoints():
+    selected_keypoints = list(range(42)) 
+    selected_keypoints = selected_keypoints + [x + 42 for x in ([291, 267, 37, 61, 84, 314, 310, 13, 80, 14] + [152])]
+    selected_keypoints = selected_keypoints + [x + 520 for x in ([2, 5, 7, 8, 11, 12, 13, 14, 15, 16])]
+    return selected_keypoints
+
+
+def process_keypoints(keypoints, target_length, selected_keypoints, augment=False, height=480, width=640, flipped_keypoints=None, indices=None):
     
-    indices = sample_indices(len(keypoints), target_length, augment=augment)
+    if indices is None:
+        indices = sample_indices(len(keypoints), target_length, augment=augment)
     keypoints = torch.tensor(keypoints[indices])
 
     valid_keypoints = keypoints != -1
@@ -1,13 +1,29 @@
 import cv2
 import mediapipe as mp
 import torch
+import torch.nn.functional as F
 import multiprocessing as mp_threading
 from torchvision.io import read_video as rv
 import numpy as np
 from functools import lru_cache
+import dataclasses
+import io
 import os
 import gc
+import itertools
+import math
+import tempfile
 import threading
+import queue
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+try:
+    import av
+except ImportError:
+    # Without PyAV, VideoDecoder decodes a temporary copy of the file with OpenCV
+    av = None
 
 # Force CPU-only execution for MediaPipe
 os.environ['MEDIAPIPE_DISABLE_GPU'] = '1'
@@ -53,11 +69,431 @@ face_options = FaceLandmarkerOptions(
     num_faces=1
 )
 
+# Hand and face crops move with the pose every frame, which the VIDEO-mode
+# trackers can't follow, so crops are detected from scratch in IMAGE mode
+gesture_image_options = dataclasses.replace(gesture_options, running_mode=VisionRunningMode.IMAGE)
+face_image_options = dataclasses.replace(face_options, running_mode=VisionRunningMode.IMAGE)
+
 mp_pose = mp.solutions.pose
+mp_holistic = mp.solutions.holistic
 
 hand_target_landmarks = list(range(21))
 face_target_landmarks = list(range(478))
 pose_target_landmarks = list(range(33))
+TOTAL_LANDMARKS = len(hand_target_landmarks) * 2 + len(face_target_landmarks) + len(pose_target_landmarks)
+FACE_OFFSET = len(hand_target_landmarks) * 2
+POSE_OFFSET = FACE_OFFSET + len(face_target_landmarks)
+
+
+def landmark_coords(landmarks, indices):
+    """(x, y, z) rows of the indexed landmarks for bulk assignment, -1 past the end of the list"""
+    n = len(landmarks)
+    return [
+        (landmarks[i].x, landmarks[i].y, landmarks[i].z) if i < n else (-1, -1, -1)
+        for i in indices
+    ]
+
+
+EXTRACTION_BACKENDS = ('tasks', 'holistic')
+
+
+class ExtractionPlan:
+    """
+    Which landmarkers to run and which of their points to keep, derived from
+    keypoint indices in the 553 layout (hands 0-41, face 42-519, pose 520-552).
+    Extraction writes only those points, hand block first, then face, then
+    pose, into a compact (T, K, 3) array. skip_face drops the face
+    landmarker entirely; its points are then missing, as in the training
+    samples where augment_framedrops drops the face block.
+    backend 'tasks' runs the pose model, gesture recognizer and face
+    landmarker separately; 'holistic' runs one holistic graph per frame
+    that produces all three (and always computes the face)
+    """
+
+    def __init__(self, selected_keypoints=range(TOTAL_LANDMARKS), skip_face=False, backend='tasks'):
+        if backend not in EXTRACTION_BACKENDS:
+            raise ValueError(f"Unknown extraction backend {backend}, expected one of {EXTRACTION_BACKENDS}")
+        self.backend = backend
+        selected = sorted(set(selected_keypoints))
+        self.hand = [i for i in selected if i < FACE_OFFSET]
+        self.face = [] if skip_face else [i - FACE_OFFSET for i in selected if FACE_OFFSET <= i < POSE_OFFSET]
+        self.pose = [i - POSE_OFFSET for i in selected if i >= POSE_OFFSET]
+        # Position of every kept point in the 553 layout
+        self.keypoints = self.hand + [i + FACE_OFFSET for i in self.face] + [i + POSE_OFFSET for i in self.pose]
+        self.size = len(self.keypoints)
+        # Rows of each landmarker's block in the compact array
+        self.hand_rows = slice(0, len(self.hand))
+        self.face_rows = slice(self.hand_rows.stop, self.hand_rows.stop + len(self.face))
+        self.pose_rows = slice(self.face_rows.stop, self.size)
+        # Per hand (offset 0 right, 21 left): rows in the hand block and landmark indices
+        n_hand = len(hand_target_landmarks)
+        self.hand_blocks = {}
+        for offset in (0, n_hand):
+            rows = [row for row, idx in enumerate(self.hand) if offset <= idx < offset + n_hand]
+            self.hand_blocks[offset] = (rows, [self.hand[row] - offset for row in rows])
+
+    @property
+    def is_full(self):
+        return self.size == TOTAL_LANDMARKS
+
+    @property
+    def run_hands(self):
+        return bool(self.hand)
+
+    @property
+    def run_face(self):
+        return bool(self.face)
+
+    @property
+    def run_pose(self):
+        return bool(self.pose)
+
+    def expand(self, keypoints):
+        """
+        Compatibility shim: compact (T, K, 3) keypoints back into the (T, 553, 3)
+        layout process_keypoints expects, with -1 for points that weren't extracted
+        """
+        if self.is_full:
+            return keypoints
+        full = torch.full((len(keypoints), TOTAL_LANDMARKS, 3), -1, dtype=keypoints.dtype)
+        full[:, self.keypoints] = keypoints
+        return full
+
+    def describe(self):
+        landmarkers = [name for name, run in
+                       (('hands', self.run_hands), ('face', self.run_face), ('pose', self.run_pose)) if run]
+        return f"{self.size} keypoints from {'+'.join(landmarkers)} ({self.backend})"
+
+# Gap left between two videos on one landmarker set, so the VIDEO-mode
+# timestamps stay monotonic across them
+SEQUENCE_GAP_MS = 10_000
+
+
+class LandmarkerSet:
+    """
+    The face landmarker, pose model and gesture recognizer used together to
+    extract one video. VIDEO-mode tasks reject timestamps that don't increase
+    across calls, so each set keeps its own running timestamp offset
+    """
+
+    def __init__(self, plan=None):
+        plan = plan or ExtractionPlan()
+        self.face_landmarker = None
+        self.pose_landmarker = None
+        self.hand_landmarker = None
+        self.hand_crop_landmarker = None
+        self.face_crop_landmarker = None
+        self.holistic = None
+        self.base_timestamp = 0
+        self.last_timestamp = -SEQUENCE_GAP_MS
+        try:
+            if plan.backend == 'holistic':
+                # One graph for pose, both hands and the 478-point face mesh
+                self.holistic = mp_holistic.Holistic(
+                    min_detection_confidence=0.3,
+                    min_tracking_confidence=0.2,
+                    model_complexity=0,  # Fastest model
+                    enable_segmentation=False,
+                    smooth_landmarks=False,
+                    refine_face_landmarks=True
+                )
+                return
+            # Landmarkers the plan doesn't need are never created
+            if plan.run_face:
+                self.face_landmarker = FaceLandmarker.create_from_options(face_options)
+            if plan.run_pose:
+                self.pose_landmarker = mp_pose.Pose(
+                    min_detection_confidence=0.3,
+                    min_tracking_confidence=0.2,
+                    model_complexity=0,  # Fastest model
+                    enable_segmentation=False,
+                    smooth_landmarks=False
+                )
+            if plan.run_hands:
+                self.hand_landmarker = GestureRecognizer.create_from_options(gesture_options)
+        except Exception:
+            self.close()
+            raise
+
+    def start_sequence(self):
+        """
+        Prepare for a new video. Pose and holistic graphs are reset; the
+        VIDEO-mode gesture recognizer and face landmarker have no reset and
+        would keep tracking the previous video's hands and face, so a used
+        set rebuilds them
+        """
+        if self.last_timestamp >= 0:
+            if self.hand_landmarker:
+                self.hand_landmarker.close()
+                self.hand_landmarker = None
+                self.hand_landmarker = GestureRecognizer.create_from_options(gesture_options)
+            if self.face_landmarker:
+                self.face_landmarker.close()
+                self.face_landmarker = None
+                self.face_landmarker = FaceLandmarker.create_from_options(face_options)
+        self.base_timestamp = self.last_timestamp + SEQUENCE_GAP_MS
+        for tracker in (self.pose_landmarker, self.holistic):
+            if tracker:
+                tracker.reset()
+
+    def timestamp(self, frame_idx, fps):
+        """Monotonic VIDEO-mode timestamp (ms) of a frame in the current video"""
+        self.last_timestamp = max(self.base_timestamp + int(1000/fps * frame_idx), self.last_timestamp + 1)
+        return self.last_timestamp
+
+    def crop_landmarkers(self):
+        """IMAGE-mode gesture recognizer and face landmarker for crops, built on first use"""
+        if self.hand_landmarker and not self.hand_crop_landmarker:
+            self.hand_crop_landmarker = GestureRecognizer.create_from_options(gesture_image_options)
+        if self.face_landmarker and not self.face_crop_landmarker:
+            self.face_crop_landmarker = FaceLandmarker.create_from_options(face_image_options)
+        return self.hand_crop_landmarker, self.face_crop_landmarker
+
+    def close(self):
+        for landmarker in (self.face_landmarker, self.pose_landmarker, self.hand_landmarker, self.holistic,
+                           self.hand_crop_landmarker, self.face_crop_landmarker):
+            if landmarker:
+                try:
+                    landmarker.close()
+                except:
+                    pass
+
+
+class LandmarkerPool:
+    """
+    Pre-initialized LandmarkerSets shared by concurrent requests. A set is
+    checked out for a whole video and returned afterwards; a set whose
+    video failed is closed and replaced, since its graphs may be in a bad state
+    """
+
+    def __init__(self, size=2, warm=True, plan=None):
+        self.size = size
+        self.plan = plan
+        self._available = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+        if warm:
+            for _ in range(size):
+                self._reserve()
+                self._available.put(self._create())
+
+    def _reserve(self):
+        """Claim a slot for a new set, False if the pool is already full"""
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return True
+            return False
+
+    def _release(self):
+        with self._lock:
+            self._created -= 1
+
+    def _create(self):
+        """Build a set for an already reserved slot, giving the slot back if that fails"""
+        try:
+            return LandmarkerSet(self.plan)
+        except Exception:
+            self._release()
+            raise
+
+    @contextmanager
+    def checkout(self):
+        try:
+            landmarkers = self._available.get_nowait()
+        except queue.Empty:
+            landmarkers = self._create() if self._reserve() else self._available.get()
+
+        try:
+            landmarkers.start_sequence()
+            yield landmarkers
+        except Exception:
+            landmarkers.close()
+            self._release()
+            raise
+        else:
+            self._available.put(landmarkers)
+
+    def close(self):
+        while True:
+            try:
+                self._available.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+# Pose landmarks used to place the regions of interest
+POSE_FACE = list(range(11))  # nose, eyes, ears, mouth
+POSE_HANDS = list(range(15, 23))  # wrists, pinkies, index fingers, thumbs
+POSE_SHOULDERS = (11, 12)
+
+
+def pose_rois(pose_landmarks, width, height, hand_margin=0.6, face_scale=2.2, min_size=32):
+    """
+    Pixel boxes (x0, y0, x1, y1) around both hands and the face from a pose
+    result. The hand box spans the pose hand points plus hand_margin
+    shoulder widths on every side, the face box is a square face_scale
+    times the extent of the pose face points. A box that would be smaller
+    than min_size pixels is returned as None
+    """
+    points = np.array([(lm.x * width, lm.y * height) for lm in pose_landmarks], dtype=np.float32)
+    left, right = POSE_SHOULDERS
+    shoulder_width = float(np.linalg.norm(points[left] - points[right])) or 0.2 * width
+
+    def clamp(x0, y0, x1, y1):
+        x0, y0 = max(0, int(x0)), max(0, int(y0))
+        x1, y1 = min(width, int(math.ceil(x1))), min(height, int(math.ceil(y1)))
+        if x1 - x0 < min_size or y1 - y0 < min_size:
+            return None
+        return x0, y0, x1, y1
+
+    hands = points[POSE_HANDS]
+    margin = hand_margin * shoulder_width
+    hand_roi = clamp(*(hands.min(axis=0) - margin), *(hands.max(axis=0) + margin))
+
+    face = points[POSE_FACE]
+    center = (face.min(axis=0) + face.max(axis=0)) / 2
+    half = face_scale * max(face.max(axis=0) - face.min(axis=0)) / 2
+    face_roi = clamp(*(center - half), *(center + half))
+
+    return hand_roi, face_roi
+
+
+def roi_image(frame, roi, max_size):
+    """mp.Image of the roi of an RGB uint8 (H, W, 3) frame, downscaled to max_size on its longest side"""
+    x0, y0, x1, y1 = roi
+    crop = frame[y0:y1, x0:x1]
+    scale = max_size / max(crop.shape[:2])
+    if scale < 1:
+        crop = cv2.resize(crop, (max(1, round(crop.shape[1] * scale)), max(1, round(crop.shape[0] * scale))),
+                          interpolation=cv2.INTER_AREA)
+    return mp.Image(image_format=mp.ImageFormat.SRGB, data=np.ascontiguousarray(crop))
+
+
+def roi_to_frame(keypoints, roi, width, height):
+    """
+    In place: landmarks (N, 3) normalized to the roi crop -> normalized to
+    the full frame. z is scaled with x, as MediaPipe measures it in image
+    widths. -1 rows (not detected) are left alone
+    """
+    x0, y0, x1, y1 = roi
+    valid = (keypoints != -1).all(axis=-1)
+    keypoints[valid, 0] = (keypoints[valid, 0] * (x1 - x0) + x0) / width
+    keypoints[valid, 1] = (keypoints[valid, 1] * (y1 - y0) + y0) / height
+    keypoints[valid, 2] *= (x1 - x0) / width
+
+
+def flip_frames(video):
+    """
+    Decoded (T, H, W, 3) uint8 frames flipped vertically, the orientation
+    the server extracts keypoints in. A numpy view, nothing is copied
+    """
+    frames = video.numpy() if torch.is_tensor(video) else np.asarray(video)
+    return frames[:, ::-1]
+
+
+def motion_scores(video, size=32):
+    """
+    Cheap per-frame motion: mean absolute difference of each frame from the
+    previous one on a small grayscale thumbnail, from (T, H, W, 3) uint8
+    frames. (T,) with 0 for frame 0
+    """
+    # Strided subsample first, so only a few pixels per thumbnail cell are read
+    step = max(1, min(video.shape[1], video.shape[2]) // (size * 4))
+    small = torch.from_numpy(np.ascontiguousarray(video[:, ::step, ::step])).float().mean(dim=-1) / 255
+    thumbnails = F.adaptive_avg_pool2d(small.unsqueeze(1), size)
+    diffs = (thumbnails[1:] - thumbnails[:-1]).abs().mean(dim=(1, 2, 3))
+    return torch.cat([diffs.new_zeros(1), diffs])
+
+
+def active_span(video, ratio=0.2, pad=4, min_length=16, smooth=5):
+    """
+    Frame span [start, end) that contains the signing, found from motion
+    energy alone so it's cheap enough to run before keypoint extraction.
+    A frame is active when its smoothed motion is above ratio of the way
+    from the quiet level (10th percentile) to the busy level (95th
+    percentile). The span runs from the first to the last active frame,
+    padded by pad frames; if it would be shorter than min_length, or the
+    clip barely moves at all, the whole clip is kept
+    """
+    num_frames = len(video)
+    if num_frames <= min_length:
+        return 0, num_frames
+
+    motion = motion_scores(video)
+    motion = F.avg_pool1d(motion.view(1, 1, -1), smooth, stride=1, padding=smooth // 2,
+                          count_include_pad=False).flatten()
+    quiet, busy = torch.quantile(motion, 0.1).item(), torch.quantile(motion, 0.95).item()
+    if busy - quiet < 1e-3:
+        return 0, num_frames
+
+    active = (motion > quiet + ratio * (busy - quiet)).nonzero().flatten()
+    start = max(0, active[0].item() - pad)
+    end = min(num_frames, active[-1].item() + pad + 1)
+    if end - start < min_length:
+        return 0, num_frames
+    return start, end
+
+
+def select_frames(video, stride=1, max_gap=None, static_weight=0.25):
+    """
+    Pick about len(video) / stride frames to run the landmarkers on, spaced
+    evenly in cumulative motion rather than in time, so fast movement is
+    sampled densely and holds sparsely. static_weight of the mean motion is
+    added to every frame so still stretches still get samples, and no two
+    picked frames are more than max_gap (default 2 * stride) apart.
+    Returns sorted frame indices, always including the first and last frame
+    """
+    num_frames = len(video)
+    if stride <= 1 or num_frames <= 2:
+        return list(range(num_frames))
+    max_gap = max_gap or max(1, int(round(2 * stride)))
+
+    motion = motion_scores(video)
+    motion = motion + static_weight * motion[1:].mean() + 1e-6
+    cumulative = torch.cumsum(motion, dim=0)
+    n_frames = max(2, math.ceil(num_frames / stride))
+    targets = torch.linspace(cumulative[0].item(), cumulative[-1].item(), n_frames)
+    picked = torch.searchsorted(cumulative, targets).clamp(max=num_frames - 1)
+    picked = torch.unique(torch.cat([picked, torch.tensor([0, num_frames - 1])]))
+
+    # Split gaps that are too long
+    gaps = picked[1:] - picked[:-1]
+    extra = [torch.arange(start + max_gap, end, max_gap)
+             for start, end in zip(picked[:-1][gaps > max_gap].tolist(), picked[1:][gaps > max_gap].tolist())]
+    if extra:
+        picked = torch.unique(torch.cat([picked] + extra))
+    return picked.tolist()
+
+
+def interpolate_keypoints(keypoints, frame_indices, total_frames):
+    """
+    Fill a (T, K, 3) sequence from keypoints (S, K, 3) extracted at the sorted
+    frame_indices, in one vectorized pass. Each frame is lerped between the
+    sampled frames around it, per keypoint, when both are valid. Otherwise
+    it takes the nearer of the two, which keeps -1 markers where a keypoint
+    was not detected rather than blending them into coordinates
+    """
+    if len(frame_indices) == total_frames:
+        return keypoints
+
+    frames = torch.as_tensor(frame_indices, device=keypoints.device)
+    targets = torch.arange(total_frames, device=keypoints.device)
+    # Sampled frames at or before / at or after every target frame, clamped at the ends
+    prev_pos = (torch.searchsorted(frames, targets, right=True) - 1).clamp(min=0)
+    next_pos = torch.searchsorted(frames, targets).clamp(max=len(frames) - 1)
+
+    prev_frames, next_frames = frames[prev_pos], frames[next_pos]
+    span = (next_frames - prev_frames).clamp(min=1)
+    weight = ((targets - prev_frames) / span).to(keypoints.dtype).view(-1, 1, 1)
+
+    prev_keypoints, next_keypoints = keypoints[prev_pos], keypoints[next_pos]
+    valid = (keypoints != -1).all(dim=-1)
+    both_valid = (valid[prev_pos] & valid[next_pos]).unsqueeze(-1)
+
+    nearest = torch.where(weight <= 0.5, prev_keypoints, next_keypoints)
+    return torch.where(both_valid, torch.lerp(prev_keypoints, next_keypoints, weight), nearest)
+
 
 def read_video(file_path):
     try:
@@ -79,16 +515,304 @@ def read_video(file_path):
         cap.release()
         return torch.stack(frames)
 
+class VideoDecoder:
+    """
+    Decodes a video straight from memory (the uploaded bytes) or from a path
+    or readable file object. Iterating yields (H, W, 3) uint8 RGB frames one
+    at a time, flipped vertically like flip_frames() unless flip=False, and
+    closes the decoder at the end. PyAV reads from memory; OpenCV only
+    opens paths, so without PyAV the bytes go through a temporary file.
+
+    max_size caps the longer side of the yielded frames; they are scaled in
+    the same pass as the colour conversion. fps drops frames down to that
+    rate before they are converted at all. height and width stay the
+    original size, so keypoints can still be reported in original pixels.
+    num_frames is the number of frames that will be yielded according to
+    the container header, 0 if it has no frame count
+    """
+
+    def __init__(self, source, flip=True, max_size=None, fps=None):
+        self.flip = flip
+        self.max_size = max_size
+        self.num_frames = 0
+        self.height = self.width = 0
+        self.fps = 0
+        self._container = None
+        self._capture = None
+        self._temp_path = None
+        try:
+            if av is not None:
+                if isinstance(source, (bytes, bytearray, memoryview)):
+                    source = io.BytesIO(source)
+                self._container = av.open(source)
+                stream = self._container.streams.video[0]
+                stream.thread_type = 'AUTO'
+                self.num_frames = stream.frames
+                self.height, self.width = stream.codec_context.height, stream.codec_context.width
+                self.fps = float(stream.average_rate or 0)
+            else:
+                if not isinstance(source, (str, os.PathLike)):
+                    data = source
+                    if hasattr(source, 'getvalue'):
+                        # The whole file, not just what an UploadBuffer has received so far
+                        data = source.getvalue()
+                    elif hasattr(source, 'read'):
+                        data = source.read()
+                    with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as tmp:
+                        tmp.write(data)
+                        self._temp_path = tmp.name
+                    source = self._temp_path
+                self._capture = cv2.VideoCapture(source)
+                if not self._capture.isOpened():
+                    raise ValueError("Could not open video file")
+                self.num_frames = max(0, int(self._capture.get(cv2.CAP_PROP_FRAME_COUNT)))
+                self.height = int(self._capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                self.width = int(self._capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+                self.fps = self._capture.get(cv2.CAP_PROP_FPS)
+        except Exception:
+            self.close()
+            raise
+        
+        # Fraction of the decoded frames that is kept, 1 keeps every frame
+        self.rate = 1.0
+        if fps and self.fps > fps:
+            self.rate = fps / self.fps
+            self.fps = fps
+            if self.num_frames:
+                self.num_frames = math.floor((self.num_frames - 1) * self.rate) + 1
+
+    def __iter__(self):
+        try:
+            for frame in self._decode():
+                yield frame[::-1] if self.flip else frame
+        finally:
+            self.close()
+
+    def _keep(self, index):
+        # Frame index crosses into the next output frame
+        return self.rate >= 1 or math.floor(index * self.rate) != math.floor((index - 1) * self.rate)
+
+    def _output_size(self, height, width):
+        """(height, width) to scale a decoded frame to, or None to keep its size"""
+        if not self.height:
+            self.height, self.width = height, width
+        if not self.max_size or max(height, width) <= self.max_size:
+            return None
+        scale = self.max_size / max(height, width)
+        return max(1, round(height * scale)), max(1, round(width * scale))
+
+    def _decode(self):
+        if self._container is not None:
+            for index, frame in enumerate(self._container.decode(self._container.streams.video[0])):
+                # Dropped frames are still decoded, later frames reference them, but never converted
+                if not self._keep(index):
+                    continue
+                size = self._output_size(frame.height, frame.width)
+                if size is None:
+                    yield frame.to_ndarray(format='rgb24')
+                else:
+                    yield frame.to_ndarray(height=size[0], width=size[1], format='rgb24', interpolation='AREA')
+            return
+        index = 0
+        while self._capture.grab():
+            # Grabbed without retrieving unless the frame is kept
+            if self._keep(index):
+                ret, frame = self._capture.retrieve()
+                if not ret:
+                    break
+                size = self._output_size(frame.shape[0], frame.shape[1])
+                if size is not None:
+                    frame = cv2.resize(frame, (size[1], size[0]), interpolation=cv2.INTER_AREA)
+                yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            index += 1
+
+    def read_all(self):
+        """Every frame as one (T, H, W, 3) array, for callers that need random access"""
+        frames = list(self)
+        if not frames:
+            raise ValueError("No frames decoded")
+        return np.stack(frames)
+
+    def close(self):
+        if self._container is not None:
+            self._container.close()
+            self._container = None
+        if self._capture is not None:
+            self._capture.release()
+            self._capture = None
+        if self._temp_path and os.path.exists(self._temp_path):
+            try:
+                os.remove(self._temp_path)
+            except OSError:
+                pass
+        self._temp_path = None
+
+
+class UploadBuffer:
+    """
+    Read-only, seekable file object over a request body that is still
+    arriving, so a VideoDecoder can demux and decode it during the upload.
+    The event loop feed()s chunks as they are received and finish()es the
+    upload; decoder threads block in read() until bytes past their position
+    have arrived. Seeks may go past what has arrived, so containers indexed
+    at the end (non-faststart MP4) still decode, just not before the upload
+    completes. `size` is the expected total size (Content-Length), without
+    it the MP4 demuxer looks for more atoms past the media data and waits for
+    the whole upload anyway. max_bytes caps the upload size. A reader that
+    gets no new bytes for `timeout` seconds raises TimeoutError
+    """
+
+    def __init__(self, size=None, max_bytes=None, timeout=None):
+        self.size = size
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self._data = bytearray()
+        self._pos = 0
+        self._done = False
+        self._error = None
+        self._cond = threading.Condition()
+
+    def feed(self, chunk):
+        with self._cond:
+            if self.max_bytes and len(self._data) + len(chunk) > self.max_bytes:
+                raise ValueError(f"Upload larger than {self.max_bytes} bytes")
+            self._data += chunk
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        """End of the upload; with an error, readers raise it instead of reaching EOF"""
+        with self._cond:
+            self._done = True
+            self._error = error
+            self._cond.notify_all()
+
+    @property
+    def done(self):
+        return self._done
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read(self, size=-1):
+        with self._cond:
+            # Whatever has arrived past the position, like a socket would
+            self._wait(lambda: self._done or len(self._data) > self._pos or self._at_end())
+            if self._error is not None:
+                raise self._error
+            end = len(self._data) if size is None or size < 0 else min(len(self._data), self._pos + size)
+            chunk = bytes(self._data[self._pos:end])
+            self._pos = max(self._pos, end)
+            return chunk
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        with self._cond:
+            if whence == io.SEEK_END:
+                # The end is unknown until everything arrived. FFmpeg probes the
+                # size this way and carries on without one on a negative answer
+                if self._done:
+                    offset += len(self._data)
+                elif self.size is not None:
+                    offset += self.size
+                else:
+                    return -1
+            elif whence == io.SEEK_CUR:
+                offset += self._pos
+            self._pos = max(0, offset)
+            return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def _at_end(self):
+        return self.size is not None and self._pos >= self.size
+
+    def _wait(self, predicate):
+        """Wait under the lock until predicate() holds, as long as bytes keep arriving"""
+        while not predicate():
+            received = len(self._data)
+            if not self._cond.wait(self.timeout) and len(self._data) == received and not predicate():
+                raise TimeoutError(f"Upload stalled, nothing received for {self.timeout} s")
+
+    def getvalue(self):
+        """All uploaded bytes, waits for the upload to finish"""
+        with self._cond:
+            self._wait(lambda: self._done)
+            if self._error is not None:
+                raise self._error
+            return bytes(self._data)
+
+
+def prefetch(iterable, depth=8):
+    """
+    Iterate over iterable on a background thread, up to depth items ahead,
+    so decoding the next frames overlaps with processing the current one.
+    Errors are raised in the consumer; stopping early stops the producer
+    """
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(kind, item=None):
+        while not stop.is_set():
+            try:
+                items.put((kind, item), timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put('item', item):
+                    break
+            put('done')
+        except Exception as e:
+            put('error', e)
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close:
+                close()
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            kind, item = items.get()
+            if kind == 'done':
+                return
+            if kind == 'error':
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
 class KeypointExtractor:
-    def __init__(self):
+    def __init__(self, pool=None, processes=None, plan=None, stride=1, roi_size=None):
         self._lock = threading.Lock()  # Thread safety
+        # Keypoints to extract, all 553 by default
+        self.plan = plan or ExtractionPlan()
+        # Without a pool every video builds and closes its own landmarkers
+        self.pool = pool
+        # ExtractionPool that splits each video over worker processes
+        self.processes = processes
+        # Average number of frames per extracted frame, 1 extracts every frame
+        self.stride = stride
+        # Longest side of the pose-guided hand/face crops, None runs on full frames
+        self.roi_size = roi_size
         
-    def extract_hand_landmarks(self, detection_result):
-        result = torch.zeros(len(hand_target_landmarks) * 2, 3, dtype=torch.float32)
-        result.fill_(-1)
+    def extract_hand_landmarks(self, detection_result, out=None):
+        """Write the plan's hand points into out (len(plan.hand), 3), -1 where not detected"""
+        if out is None:
+            out = np.full((len(self.plan.hand), 3), -1, dtype=np.float32)
         
-        if not detection_result.hand_landmarks:
-            return result
+        if detection_result is None or not detection_result.hand_landmarks:
+            return out
             
         for i, hand_landmarks in enumerate(detection_result.hand_landmarks):
             if i >= len(detection_result.handedness):
@@ -96,310 +820,383 @@ class KeypointExtractor:
                 
             hand_label = detection_result.handedness[i][0].category_name.lower()
             offset = 0 if hand_label != 'left' else len(hand_target_landmarks)
-            
-            for j, landmark in enumerate(hand_landmarks):
-                if j < len(hand_target_landmarks):
-                    idx = j + offset
-                    if idx < len(result):
-                        result[idx][0] = landmark.x
-                        result[idx][1] = landmark.y
-                        result[idx][2] = landmark.z
+            rows, indices = self.plan.hand_blocks[offset]
+            if rows:
+                out[rows] = landmark_coords(hand_landmarks, indices)
         
-        return result
+        return out
     
-    def extract_pose_landmarks(self, detection_result):
-        result = torch.zeros(len(pose_target_landmarks), 3, dtype=torch.float32)
-        result.fill_(-1)
+    def extract_pose_landmarks(self, detection_result, out=None):
+        """Write the plan's pose points into out (len(plan.pose), 3), -1 where not detected"""
+        if out is None:
+            out = np.full((len(self.plan.pose), 3), -1, dtype=np.float32)
         
-        if detection_result.pose_landmarks:
-            landmarks = detection_result.pose_landmarks.landmark
-            for i, idx in enumerate(pose_target_landmarks):
-                if idx < len(landmarks):
-                    landmark = landmarks[idx]
-                    result[i][0] = landmark.x
-                    result[i][1] = landmark.y
-                    result[i][2] = landmark.z
+        if detection_result is not None and detection_result.pose_landmarks and self.plan.pose:
+            out[:] = landmark_coords(detection_result.pose_landmarks.landmark, self.plan.pose)
         
-        return result
+        return out
     
-    def extract_face_landmarks(self, detection_result):
-        result = torch.zeros(len(face_target_landmarks), 3, dtype=torch.float32)
-        result.fill_(-1)
+    def extract_face_landmarks(self, detection_result, out=None):
+        """Write the plan's face points into out (len(plan.face), 3), -1 where not detected"""
+        if out is None:
+            out = np.full((len(self.plan.face), 3), -1, dtype=np.float32)
+        
+        if detection_result is not None and detection_result.face_landmarks and self.plan.face:
+            out[:] = landmark_coords(detection_result.face_landmarks[0], self.plan.face)
+        
+        return out
+
+    def _process_holistic(self, holistic, frame_np, row):
+        """
+        One holistic pass over a frame, written into the same rows as the
+        tasks backend. The holistic graph crops hands and face around the
+        pose itself, so roi_size doesn't apply
+        """
+        frame_np.flags.writeable = False
+        result = holistic.process(frame_np)
+        
+        # The gesture recognizer labels hands as if the image were mirrored,
+        # so its 'Left' hand (offset 21) is the holistic right hand
+        hand_rows = row[self.plan.hand_rows]
+        for offset, hand in ((0, result.left_hand_landmarks), (len(hand_target_landmarks), result.right_hand_landmarks)):
+            rows, indices = self.plan.hand_blocks[offset]
+            if hand and rows:
+                hand_rows[rows] = landmark_coords(hand.landmark, indices)
         
-        if detection_result.face_landmarks and len(detection_result.face_landmarks) > 0:
-            face_landmarks = detection_result.face_landmarks[0]
-            for i, landmark in enumerate(face_landmarks):
-                if i < len(face_target_landmarks):
-                    result[i][0] = landmark.x
-                    result[i][1] = landmark.y
-                    result[i][2] = landmark.z
+        if result.face_landmarks and self.plan.face:
+            row[self.plan.face_rows] = landmark_coords(result.face_landmarks.landmark, self.plan.face)
         
-        return result
+        self.extract_pose_landmarks(result, row[self.plan.pose_rows])
 
-    def extract_fast_parallel(self, video, fps=24):
+    def extract_fast_parallel(self, video, fps=24, frames=None, size=None):
         """
         Safe implementation that avoids memory corruption
         """
         with self._lock:  # Thread safety
-            return self._extract_safe_sequential(video, fps)
+            return self._extract_safe_sequential(video, fps, frames, size)
     
-    def extract_safe_parallel(self, video, fps=24):
+    def extract_safe_parallel(self, video, fps=24, frames=None, size=None):
         """
-        Completely safe sequential processing - no parallel execution
+        Safe processing - parallel only across worker processes, if configured
         """
-        return self._extract_safe_sequential(video, fps)
+        return self._extract_safe_sequential(video, fps, frames, size)
     
-    def extract_sequential_safe(self, video, fps=24):
+    def extract_sequential_safe(self, video, fps=24, frames=None, size=None):
         """
         Ultra-safe sequential processing
         """
-        return self._extract_safe_sequential(video, fps)
+        return self._extract_safe_sequential(video, fps, frames, size)
 
-    def _extract_safe_sequential(self, video, fps=24):
+    def _extract_safe_sequential(self, video, fps=24, frames=None, size=None):
         """
-        Single-threaded keypoint extraction to prevent malloc corruption
+        Single-threaded keypoint extraction to prevent malloc corruption.
+        `video` is (T, H, W, 3) uint8 frames, as from flip_frames().
+        `frames` limits extraction to those frame indices; every other frame
+        is left at -1. With a stride, MediaPipe runs on about 1 in stride of
+        them, picked by motion, and the rest of them are interpolated.
+        Frames keep their real index in the tracker timestamps. Keypoints are scaled to
+        `size` (height, width), the frame size by default, so frames
+        downscaled while decoding still give original-resolution pixels
         """
         num_frames = len(video)
-        stride = 1
-        # # Smart frame selection based on video length
-        # if num_frames > 150:
-        #     stride = 4  # Process every 4th frame for very long videos
-        # elif num_frames > 100:
-        #     stride = 3  # Process every 3rd frame
-        # elif num_frames > 50:
-        #     stride = 2  # Process every 2nd frame
-        # else:
-        #     stride = 1  # Process all frames for short videos
-            
-        selected_indices = list(range(0, num_frames, stride))
-        video_subset = video[selected_indices]
-        
-        print(f"Processing {len(video_subset)} frames out of {num_frames} (stride={stride})")
+        if frames is not None:
+            requested = sorted(frames)
+            # Spend the frame budget where the requested frames move
+            picked = select_frames(video[requested], self.stride) if self.stride > 1 else range(len(requested))
+            selected_indices = [requested[i] for i in picked]
+        else:
+            # Spend the frame budget where the video moves
+            selected_indices = select_frames(video, self.stride)
+        # Frames stay views into the decoded video unless some are skipped
+        video_subset = video if len(selected_indices) == num_frames else video[selected_indices]
         
-        # Initialize MediaPipe models once
-        face_landmarker = None
-        pose_landmarker = None
-        hand_landmarker = None
+        print(f"Processing {len(video_subset)} frames out of {num_frames} (stride={self.stride})")
         
         try:
-            # Create models with minimal resource usage
-            face_landmarker = FaceLandmarker.create_from_options(face_options)
-            pose_landmarker = mp_pose.Pose(
-                min_detection_confidence=0.3,
-                min_tracking_confidence=0.2,
-                model_complexity=0,  # Fastest model
-                enable_segmentation=False,
-                smooth_landmarks=False
-            )
-            hand_landmarker = GestureRecognizer.create_from_options(gesture_options)
-            
-            results = []
-            height, width = video.shape[2], video.shape[3]
-            
-            # Process frames one by one
-            for frame_idx, frame in enumerate(video_subset):
-                try:
-                    timestamp = int(1000/fps * frame_idx)
-                    
-                    # Safe frame conversion
-                    if frame.is_cuda:
-                        frame = frame.cpu()
-                    
-                    # Convert to numpy safely
-                    frame_np = frame.permute(1, 2, 0).numpy()
-                    if frame_np.dtype != np.uint8:
-                        frame_np = np.clip(frame_np * 255, 0, 255).astype(np.uint8)
-                    
-                    # Ensure contiguous memory layout
-                    frame_np = np.ascontiguousarray(frame_np)
-                    
-                    # Process with pose (most stable)
-                    image_rgb = frame_np.copy()
-                    image_rgb.flags.writeable = False
-                    pose_result = pose_landmarker.process(image_rgb)
-                    
-                    # Process with MediaPipe tasks
-                    image_mp = mp.Image(image_format=mp.ImageFormat.SRGB, data=frame_np)
-                    hands_result = hand_landmarker.recognize_for_video(image_mp, timestamp)
-                    face_result = face_landmarker.detect_for_video(image_mp, timestamp)
-                    
-                    # Extract landmarks
-                    hand_landmarks = self.extract_hand_landmarks(hands_result)
-                    face_landmarks = self.extract_face_landmarks(face_result)
-                    pose_landmarks = self.extract_pose_landmarks(pose_result)
-                    
-                    # Combine landmarks
-                    combined_result = torch.cat([
-                        hand_landmarks,
-                        face_landmarks,
-                        pose_landmarks
-                    ], dim=0)
-                    
-                    results.append(combined_result)
-                    
-                    # Clear intermediate variables
-                    del frame_np, image_rgb, image_mp
-                    del hands_result, face_result, pose_result
-                    del hand_landmarks, face_landmarks, pose_landmarks
-                    
-                    # Periodic garbage collection for long videos
-                    if frame_idx % 20 == 0:
-                        gc.collect()
-                    
-                except Exception as e:
-                    print(f"Error processing frame {frame_idx}: {e}")
-                    # Add empty result to maintain frame consistency
-                    total_landmarks = (len(hand_target_landmarks) * 2 + 
-                                     len(face_target_landmarks) + 
-                                     len(pose_target_landmarks))
-                    empty_result = torch.zeros(total_landmarks, 3, dtype=torch.float32) - 1
-                    results.append(empty_result)
+            if self.processes is not None and len(video_subset) > 1:
+                results_tensor = self.processes.extract(video_subset, fps, frame_indices=selected_indices)
+            else:
+                with self._landmarkers() as landmarkers:
+                    results_tensor = self._process_frames(landmarkers, video_subset, fps, frame_indices=selected_indices)
         
         except Exception as e:
             print(f"Critical error in keypoint extraction: {e}")
             # Return empty results
-            total_landmarks = (len(hand_target_landmarks) * 2 + 
-                             len(face_target_landmarks) + 
-                             len(pose_target_landmarks))
-            num_frames_to_process = len(video_subset)
-            return torch.zeros((num_frames_to_process, total_landmarks, 3), dtype=torch.float32) - 1
+            return torch.zeros((num_frames, self.plan.size, 3), dtype=torch.float32) - 1
         
         finally:
-            # Clean up MediaPipe resources
-            if face_landmarker:
-                try:
-                    face_landmarker.close()
-                except:
-                    pass
-            if pose_landmarker:
-                try:
-                    pose_landmarker.close()
-                except:
-                    pass
-            if hand_landmarker:
-                try:
-                    hand_landmarker.close()
-                except:
-                    pass
-            
             # Force garbage collection
             gc.collect()
         
-        if not results:
+        if len(results_tensor) == 0:
             print("No results generated")
-            total_landmarks = (len(hand_target_landmarks) * 2 + 
-                             len(face_target_landmarks) + 
-                             len(pose_target_landmarks))
-            return torch.zeros((1, total_landmarks, 3), dtype=torch.float32) - 1
+            return torch.zeros((1, self.plan.size, 3), dtype=torch.float32) - 1
         
         # Convert to tensor and scale
-        results_tensor = torch.stack(results)
+        height, width = size or (video.shape[1], video.shape[2])
         scale_tensor = torch.tensor([width, height, 1], dtype=torch.float32)
-        scaled_results = results_tensor * scale_tensor
+        scaled_results = results_tensor.mul_(scale_tensor)
         
-        # Interpolate if we used stride > 1
-        if stride > 1:
-            final_results = self._safe_interpolation(scaled_results, selected_indices, num_frames)
-        else:
-            final_results = scaled_results
+        # Fill the frames MediaPipe didn't run on
+        final_results = interpolate_keypoints(scaled_results, selected_indices, num_frames)
+        if frames is not None:
+            # Frames outside the requested set are never read
+            requested_results = final_results[requested]
+            final_results = torch.full((num_frames, self.plan.size, 3), -1, dtype=torch.float32)
+            final_results[requested] = requested_results
         
         print(f"Keypoint extraction completed. Final shape: {final_results.shape}")
         return final_results
 
-    def _safe_interpolation(self, keypoints, selected_indices, total_frames):
+    def extract_stream(self, frames, fps=24, keep=None, size=None):
         """
-        Memory-safe interpolation with OpenMP parallelization
+        Extract keypoints from an iterable of (H, W, 3) uint8 frames as they
+        arrive, e.g. a VideoDecoder, without ever holding the whole video.
+        Only frame indices in `keep` are extracted and the others stay -1;
+        keep=None extracts every frame. Returns pose (T, K, 3) in pixels of
+        `size` (height, width, the frame size by default), height and width
         """
-        if len(selected_indices) == total_frames:
-            return keypoints
+        rows = []
+        extracted = 0
+        height = width = None
+        # A landmarker set is only checked out once frames arrive, so a
+        # stalled upload doesn't hold one while nothing can be extracted
+        frames = iter(frames)
+        first = next(frames, None)
+        if first is None:
+            raise ValueError("No frames decoded")
+        with self._landmarkers() as landmarkers:
+            for frame_idx, frame in enumerate(itertools.chain([first], frames)):
+                if height is None:
+                    height, width = size or (frame.shape[0], frame.shape[1])
+                    scale = np.array([width, height, 1], dtype=np.float32)
+                row = np.full((self.plan.size, 3), -1, dtype=np.float32)
+                if keep is None or frame_idx in keep:
+                    self._process_frame(landmarkers, frame, frame_idx, fps, row)
+                    row *= scale
+                    extracted += 1
+                rows.append(row)
+                
+                # Periodic garbage collection for long videos
+                if frame_idx % 20 == 0:
+                    gc.collect()
         
-        # Calculate stride
-        stride = selected_indices[1] - selected_indices[0] if len(selected_indices) > 1 else 1
+        print(f"Streamed {len(rows)} frames, extracted {extracted}")
+        return torch.from_numpy(np.stack(rows)), height, width
+
+    def extract_frame(self, landmarkers, frame, frame_idx, fps=24):
+        """
+        Keypoints (K, 3) in pixels of one (H, W, 3) uint8 frame, for callers
+        that keep their own LandmarkerSet running over a live stream
+        """
+        row = np.full((self.plan.size, 3), -1, dtype=np.float32)
+        self._process_frame(landmarkers, frame, frame_idx, fps, row)
+        row *= np.array([frame.shape[1], frame.shape[0], 1], dtype=np.float32)
+        return row
+
+    @contextmanager
+    def _landmarkers(self):
+        """Check a landmarker set out of the pool, or build a private one for this video"""
+        if self.pool is not None:
+            with self.pool.checkout() as landmarkers:
+                yield landmarkers
+            return
+
+        landmarkers = LandmarkerSet(self.plan)
+        try:
+            landmarkers.start_sequence()
+            yield landmarkers
+        finally:
+            # Clean up MediaPipe resources
+            landmarkers.close()
+
+    def _process_frames(self, landmarkers, video_subset, fps, first_frame=0, out=None, frame_indices=None):
+        """
+        Run the landmarkers over every frame, writing the plan's keypoints into
+        out, a preallocated float32 (T, K, 3) array. Timestamps follow the
+        frames' indices in the video, `frame_indices` when only some of its
+        frames are passed. Returns out as a tensor sharing its memory
+        """
+        if out is None:
+            out = np.empty((len(video_subset), self.plan.size, 3), dtype=np.float32)
+        out.fill(-1)
+        
+        # Process frames one by one
+        for frame_idx, frame in enumerate(video_subset):
+            video_idx = frame_indices[frame_idx] if frame_indices is not None else first_frame + frame_idx
+            self._process_frame(landmarkers, frame, video_idx, fps, out[frame_idx])
+            
+            # Periodic garbage collection for long videos
+            if frame_idx % 20 == 0:
+                gc.collect()
         
+        return torch.from_numpy(out)
+
+    def _process_frame(self, landmarkers, frame, frame_idx, fps, row):
+        """Landmarks of one (H, W, 3) uint8 frame into row, left at -1 if it fails"""
         try:
-            # Use PyTorch's vectorized operations (automatically uses OpenMP)
-            device = keypoints.device
-            dtype = keypoints.dtype
+            timestamp = landmarkers.timestamp(frame_idx, fps)
+            
+            # Ensure contiguous memory layout, the only copy of the frame
+            frame_np = np.ascontiguousarray(frame)
             
-            full_results = torch.zeros((total_frames, keypoints.shape[1], keypoints.shape[2]), 
-                                     dtype=dtype, device=device)
+            if landmarkers.holistic:
+                self._process_holistic(landmarkers.holistic, frame_np, row)
+                return
             
-            # Vectorized copying of existing keypoints
-            valid_keypoint_indices = torch.arange(len(keypoints), device=device)
-            frame_indices = torch.tensor(selected_indices, device=device)
+            # Only the landmarkers in the extraction plan exist
+            image_rgb = pose_result = hands_result = face_result = None
             
-            # Ensure we don't exceed bounds
-            valid_mask = (valid_keypoint_indices < len(keypoints)) & (frame_indices < total_frames)
-            valid_keypoint_idx = valid_keypoint_indices[valid_mask]
-            valid_frame_idx = frame_indices[valid_mask]
+            # Process with pose (most stable)
+            if landmarkers.pose_landmarker:
+                image_rgb = frame_np.copy()
+                image_rgb.flags.writeable = False
+                pose_result = landmarkers.pose_landmarker.process(image_rgb)
             
-            if len(valid_keypoint_idx) > 0:
-                full_results[valid_frame_idx] = keypoints[valid_keypoint_idx]
+            # Hand and face regions from the pose, full frame without one
+            hand_roi = face_roi = None
+            if self.roi_size and pose_result is not None and pose_result.pose_landmarks:
+                hand_roi, face_roi = pose_rois(pose_result.pose_landmarks.landmark, frame_np.shape[1], frame_np.shape[0])
             
-            # Parallel interpolation for missing frames
-            all_indices = torch.arange(total_frames, device=device)
-            selected_set = set(selected_indices)
-            missing_indices = torch.tensor([i for i in range(total_frames) if i not in selected_set], 
-                                         device=device)
+            # Process with MediaPipe tasks: crops in IMAGE mode, the full frame
+            # with the VIDEO-mode trackers
+            image_mp = mp.Image(image_format=mp.ImageFormat.SRGB, data=frame_np)
+            if landmarkers.hand_landmarker:
+                if hand_roi:
+                    hand_crop_landmarker = landmarkers.crop_landmarkers()[0]
+                    hands_result = hand_crop_landmarker.recognize(roi_image(frame_np, hand_roi, self.roi_size))
+                else:
+                    hands_result = landmarkers.hand_landmarker.recognize_for_video(image_mp, timestamp)
+            if landmarkers.face_landmarker:
+                if face_roi:
+                    face_crop_landmarker = landmarkers.crop_landmarkers()[1]
+                    face_result = face_crop_landmarker.detect(roi_image(frame_np, face_roi, self.roi_size))
+                else:
+                    face_result = landmarkers.face_landmarker.detect_for_video(image_mp, timestamp)
             
-            if len(missing_indices) > 0:
-                # Vectorized interpolation
-                for idx in missing_indices:
-                    idx_val = idx.item()
-                    
-                    # Find nearest keypoints
-                    prev_indices = [i for i in selected_indices if i < idx_val]
-                    next_indices = [i for i in selected_indices if i > idx_val]
-                    
-                    if prev_indices and next_indices:
-                        prev_idx = max(prev_indices)
-                        next_idx = min(next_indices)
-                        
-                        weight = (idx_val - prev_idx) / (next_idx - prev_idx)
-                        full_results[idx] = ((1 - weight) * full_results[prev_idx] + 
-                                           weight * full_results[next_idx])
-                    elif prev_indices:
-                        full_results[idx] = full_results[max(prev_indices)]
-                    elif next_indices:
-                        full_results[idx] = full_results[min(next_indices)]
+            # Extract landmarks straight into this frame's rows
+            self.extract_hand_landmarks(hands_result, row[self.plan.hand_rows])
+            self.extract_face_landmarks(face_result, row[self.plan.face_rows])
+            self.extract_pose_landmarks(pose_result, row[self.plan.pose_rows])
             
-            return full_results
+            # Crop-relative coordinates back to the full frame
+            if hand_roi:
+                roi_to_frame(row[self.plan.hand_rows], hand_roi, frame_np.shape[1], frame_np.shape[0])
+            if face_roi:
+                roi_to_frame(row[self.plan.face_rows], face_roi, frame_np.shape[1], frame_np.shape[0])
             
         except Exception as e:
-            print(f"Parallel interpolation error: {e}, falling back to simple method")
-            return self._simple_interpolation_fallback(keypoints, selected_indices, total_frames)
+            print(f"Error processing frame {frame_idx}: {e}")
+            # Mark the whole frame missing to maintain frame consistency
+            row[:] = -1
+
+
+# Per-process state of ExtractionPool workers
+_worker_extractor = None
+_worker_landmarkers = None
+
 
-    def _simple_interpolation_fallback(self, keypoints, selected_indices, total_frames):
+def _init_extraction_worker(plan, roi_size):
+    global _worker_extractor, _worker_landmarkers
+    _worker_extractor = KeypointExtractor(plan=plan, roi_size=roi_size)
+    _worker_landmarkers = LandmarkerSet(plan)
+
+
+def _extraction_worker_ready():
+    return os.getpid()
+
+
+def _run_chunk(frames, out, start, stop, fps, frame_indices=None):
+    global _worker_landmarkers
+    chunk = frames[start:stop]
+    chunk_indices = frame_indices[start:stop] if frame_indices is not None else None
+    try:
+        _worker_landmarkers.start_sequence()
+        # Landmarks land directly in the shared output
+        _worker_extractor._process_frames(_worker_landmarkers, chunk, fps, first_frame=start, out=out[start:stop],
+                                          frame_indices=chunk_indices)
+    except Exception as e:
+        print(f"Error extracting frames {start}-{stop}: {e}")
+        out[start:stop] = -1
+        # Graphs may be in a bad state, rebuild them for the next chunk
+        _worker_landmarkers.close()
+        _worker_landmarkers = LandmarkerSet(_worker_extractor.plan)
+
+
+def _extract_chunk(frames_name, out_name, shape, start, stop, fps, frame_indices=None):
+    """Worker side: landmarks of frames [start, stop) written into the shared output"""
+    frames_shm = shared_memory.SharedMemory(name=frames_name)
+    out_shm = shared_memory.SharedMemory(name=out_name)
+    frames = np.ndarray(shape, dtype=np.uint8, buffer=frames_shm.buf)
+    out = np.ndarray((shape[0], _worker_extractor.plan.size, 3), dtype=np.float32, buffer=out_shm.buf)
+    _run_chunk(frames, out, start, stop, fps, frame_indices)
+    # Views must be gone before the segments can be closed
+    del frames, out
+    frames_shm.close()
+    out_shm.close()
+    return stop - start
+
+
+class ExtractionPool:
+    """
+    Keypoint extraction spread over worker processes. Every worker owns its
+    own LandmarkerSet, so MediaPipe graphs are never shared between threads.
+    A video is copied once into shared memory as uint8 (T, H, W, 3) and cut
+    into contiguous frame chunks; workers write their landmarks straight into
+    a shared (T, K, 3) output, so no frames or results are pickled.
+    Workers are spawned, not forked, and re-import the launch script
+    """
+
+    def __init__(self, workers=4, min_chunk=16, plan=None, roi_size=None):
+        self.workers = workers
+        self.min_chunk = min_chunk
+        self.plan = plan or ExtractionPlan()
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=mp_threading.get_context('spawn'),
+            initializer=_init_extraction_worker,
+            initargs=(self.plan, roi_size),
+        )
+
+    def warm(self):
+        """Start every worker and build its landmarkers before the first request"""
+        futures = [self.executor.submit(_extraction_worker_ready) for _ in range(self.workers)]
+        pids = {future.result() for future in futures}
+        print(f"Keypoint extraction pool started ({len(pids)} of {self.workers} workers running)")
+
+    def chunks(self, num_frames):
+        n_chunks = max(1, min(self.workers, num_frames // self.min_chunk))
+        bounds = np.linspace(0, num_frames, n_chunks + 1).astype(int)
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def extract(self, video, fps=24, frame_indices=None):
         """
-        Simple fallback interpolation method
+        (T, H, W, 3) uint8 frames -> (T, K, 3) normalized landmarks of the plan.
+        `frame_indices` are the frames' indices in the video, for the tracker timestamps
         """
-        full_results = torch.zeros((total_frames, keypoints.shape[1], keypoints.shape[2]), 
-                                 dtype=keypoints.dtype, device=keypoints.device)
-        full_results.fill_(-1)
-        
-        # Copy existing keypoints
-        for i, idx in enumerate(selected_indices):
-            if i < len(keypoints) and idx < total_frames:
-                full_results[idx] = keypoints[i]
-        
-        # Simple linear interpolation
-        selected_set = set(selected_indices)
-        for idx in range(total_frames):
-            if idx in selected_set:
-                continue
-            
-            prev_indices = [i for i in selected_indices if i < idx]
-            next_indices = [i for i in selected_indices if i > idx]
-            
-            if prev_indices and next_indices:
-                prev_idx = max(prev_indices)
-                next_idx = min(next_indices)
-                weight = (idx - prev_idx) / (next_idx - prev_idx)
-                full_results[idx] = ((1 - weight) * full_results[prev_idx] + 
-                                   weight * full_results[next_idx])
-            elif prev_indices:
-                full_results[idx] = full_results[max(prev_indices)]
-            elif next_indices:
-                full_results[idx] = full_results[min(next_indices)]
-        
-        return full_results
\ No newline at end of file
+        num_frames, height, width, _ = video.shape
+        shape = (num_frames, height, width, 3)
+        frames_shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+        out_shm = shared_memory.SharedMemory(create=True, size=num_frames * self.plan.size * 3 * 4)
+        try:
+            frames = np.ndarray(shape, dtype=np.uint8, buffer=frames_shm.buf)
+            frames[:] = video
+            futures = [
+                self.executor.submit(_extract_chunk, frames_shm.name, out_shm.name, shape, int(start), int(stop), fps,
+                                     frame_indices)
+                for start, stop in self.chunks(num_frames)
+            ]
+            for future in futures:
+                future.result()
+            out = np.ndarray((num_frames, self.plan.size, 3), dtype=np.float32, buffer=out_shm.buf)
+            results = torch.from_numpy(out.copy())
+            del frames, out
+            return results
+        finally:
+            frames_shm.close()
+            frames_shm.unlink()
+            out_shm.close()
+            out_shm.unlink()
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
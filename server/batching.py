@@ -0,0 +1,111 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+
+class MicroBatcher:
+    """
+    Cross-request dynamic micro-batching for SLR inference.
+
+    Requests submit their (S, T, K, 3) keypoint batches. The first waiting
+    request opens a window of `max_wait_ms`; everything that arrives within it,
+    up to `max_batch_size` samples, is concatenated into a single classifier
+    forward on a dedicated worker thread, and the logits are scattered back.
+    """
+
+    def __init__(self, classifier, max_batch_size=64, max_wait_ms=8):
+        self.classifier = classifier
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        # One worker so forwards never compete for the intra-op threads
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slr-batcher")
+        self.queue = None
+        self.worker = None
+        # Request that did not fit in the previous batch
+        self.carry = None
+        self.batches = 0
+        self.requests = 0
+        self.samples = 0
+
+    async def submit(self, keypoints, valid_keypoints):
+        """Returns the logits (S, n_classes) for this request's samples"""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((keypoints, valid_keypoints, future))
+        return await future
+
+    async def run(self, fn, *args):
+        """Run fn on the inference worker thread without batching it with other requests"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "samples": self.samples,
+            "mean_batch_size": round(self.samples / self.batches, 2) if self.batches else 0,
+        }
+
+    def _ensure_started(self):
+        if self.worker is None or self.worker.done():
+            self.queue = asyncio.Queue()
+            self.carry = None
+            self.worker = asyncio.get_running_loop().create_task(self._run())
+
+    def _can_merge(self):
+        # Early exit decides on the whole batch, so requests must not be mixed
+        return getattr(self.classifier, 'supports_micro_batching', True)
+
+    async def _collect(self):
+        if self.carry is not None:
+            pending, self.carry = [self.carry], None
+        else:
+            pending = [await self.queue.get()]
+        size = len(pending[0][0])
+        if not self._can_merge():
+            return pending
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if size + len(item[0]) > self.max_batch_size:
+                # Doesn't fit, run it first in the next batch
+                self.carry = item
+                break
+            pending.append(item)
+            size += len(item[0])
+        return pending
+
+    def _forward(self, keypoints, valid_keypoints):
+        with torch.no_grad():
+            return self.classifier(keypoints, valid_keypoints)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = await self._collect()
+            sizes = [len(keypoints) for keypoints, _, _ in pending]
+            try:
+                keypoints = torch.cat([keypoints for keypoints, _, _ in pending])
+                valid_keypoints = torch.cat([valid for _, valid, _ in pending])
+                logits = await loop.run_in_executor(self.executor, self._forward, keypoints, valid_keypoints)
+            except Exception as e:
+                for _, _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.requests += len(pending)
+            self.samples += sum(sizes)
+            for (_, _, future), request_logits in zip(pending, logits.split(sizes)):
+                if not future.done():
+                    future.set_result(request_logits)
@@ -0,0 +1,116 @@
+"""
+Benchmark keypoint extraction backends against each other.
+
+Extracts every clip with each backend (the first one is the reference) and
+reports time per frame, how often each keypoint block is detected and the
+mean pixel distance to the reference where both detected it. With
+--checkpoint it also compares the model's top-1 predictions.
+
+    python benchmark_extraction.py
+    python benchmark_extraction.py --backends tasks holistic --checkpoint ./models/big_model.pth
+"""
+import argparse
+import os
+import time
+
+import torch
+
+from parity_check import compare, predict
+from VideoDataset import get_selected_keypoints
+from VideoLoader import (
+    EXTRACTION_BACKENDS, FACE_OFFSET, POSE_OFFSET, TOTAL_LANDMARKS,
+    ExtractionPlan, KeypointExtractor, flip_frames, read_video,
+)
+
+BLOCKS = {'hands': (0, FACE_OFFSET), 'face': (FACE_OFFSET, POSE_OFFSET), 'pose': (POSE_OFFSET, TOTAL_LANDMARKS)}
+
+
+def load_videos(video_dir):
+    videos = []
+    for name in sorted(os.listdir(video_dir)):
+        if not name.endswith('.mp4'):
+            continue
+        video = read_video(os.path.join(video_dir, name))
+        if video is None:
+            continue
+        videos.append((name, flip_frames(video)))
+    return videos
+
+
+def extract_all(videos, plan):
+    """(name, pose (T, 553, 3), height, width) per clip and the total extraction time"""
+    extractor = KeypointExtractor(plan=plan)
+    samples = []
+    elapsed = 0.0
+    for name, video in videos:
+        start = time.perf_counter()
+        pose = extractor.extract_safe_parallel(video)
+        elapsed += time.perf_counter() - start
+        samples.append((name, plan.expand(pose), video.shape[1], video.shape[2]))
+    return samples, elapsed
+
+
+def block_agreement(reference, candidate, keypoints):
+    """Per block: detection rate and mean pixel distance on points both backends detected"""
+    report = {}
+    for block, (start, end) in BLOCKS.items():
+        columns = [k for k in keypoints if start <= k < end]
+        if not columns:
+            continue
+        ref = torch.cat([pose[:, columns] for _, pose, _, _ in reference])
+        cand = torch.cat([pose[:, columns] for _, pose, _, _ in candidate])
+        ref_valid = (ref != -1).all(dim=-1)
+        cand_valid = (cand != -1).all(dim=-1)
+        both = ref_valid & cand_valid
+        distance = (ref[..., :2] - cand[..., :2]).norm(dim=-1)[both].mean().item() if both.any() else float('nan')
+        report[block] = (cand_valid.float().mean().item(), distance)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--videos', default='./test_videos')
+    parser.add_argument('--backends', nargs='+', default=list(EXTRACTION_BACKENDS), choices=EXTRACTION_BACKENDS)
+    parser.add_argument('--all-keypoints', action='store_true', help='extract all 553 points, not just the selected ones')
+    parser.add_argument('--checkpoint', help='also compare model predictions')
+    parser.add_argument('--samples', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    videos = load_videos(args.videos)
+    if not videos:
+        parser.error(f"no videos in {args.videos}")
+    n_frames = sum(len(video) for _, video in videos)
+    keypoints = list(range(TOTAL_LANDMARKS)) if args.all_keypoints else get_selected_keypoints()
+    print(f"Extracting {len(videos)} clips, {n_frames} frames")
+
+    results = {}
+    for backend in args.backends:
+        samples, elapsed = extract_all(videos, ExtractionPlan(keypoints, backend=backend))
+        results[backend] = samples
+        print(f"{backend:<9} {elapsed / n_frames * 1000:>7.1f} ms/frame")
+
+    reference_backend = args.backends[0]
+    reference = results[reference_backend]
+    print(f"\nDetection rate / mean px distance to {reference_backend}")
+    for backend, samples in results.items():
+        report = block_agreement(reference, samples, keypoints)
+        print(f"{backend:<9} " + "  ".join(
+            f"{block} {rate:.2f} / {distance:.1f}" for block, (rate, distance) in report.items()
+        ))
+
+    if args.checkpoint:
+        from inference import build_model
+
+        model = build_model(args.checkpoint, precision='fp32')
+        ref_logits, _ = predict(model, reference, args.samples, args.seed)
+        for backend, samples in results.items():
+            if backend == reference_backend:
+                continue
+            logits, _ = predict(model, samples, args.samples, args.seed)
+            top1, top1_in_top5, overlap = compare(ref_logits, logits)
+            print(f"{backend}: top-1 agreement {top1:.3f}, top-1 in top-5 {top1_in_top5:.3f}, top-5 overlap {overlap:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Fit early-exit thresholds on a held-out keypoint set.
+
+Attaches exit classifiers after intermediate SLR blocks, optionally trains
+them on a separate split (the backbone stays frozen), then picks for each
+exit the lowest softmax-margin threshold whose exits still agree with the
+full model at the requested rate. Reports the blocks and model time saved
+against the accuracy lost and writes the exits for SLR_EARLY_EXIT.
+
+    python calibrate_early_exit.py --split val.csv --keypoints-path keypoints/
+    python calibrate_early_exit.py --split val.csv --keypoints-path keypoints/ --train-split train.csv --layers 1 2 3 4
+"""
+import argparse
+import time
+
+import pandas as pd
+import torch
+import torch.nn.functional as F
+
+from inference import build_model, keep_float32_outside_blocks, precision_context, save_early_exits
+from model import softmax_margin
+from parity_check import load_keypoint_files
+from tta import build_tta_batch
+from VideoDataset import get_selected_keypoints
+
+
+def tta_batches(samples, sample_amount, seed):
+    for i, (name, pose, height, width) in enumerate(samples):
+        yield build_tta_batch(
+            pose, get_selected_keypoints(), sample_amount,
+            height=height, width=width, seed=seed + i
+        )
+
+
+def collect_features(model, batches, layers):
+    """cls token after every exit layer, per sample (S, n_embd), plus the final logits"""
+    features = {layer: [] for layer in layers}
+    final_logits = []
+    with torch.no_grad(), precision_context(model):
+        for keypoints, valid_keypoints in batches:
+            x = model.embed(keypoints, valid_keypoints)
+            for i, block in enumerate(model.blocks):
+                x = block(x)
+                if i in features:
+                    features[i].append(x[:, 0].float())
+            final_logits.append(model.heads[model.exit_head](model.layernorm(x[:, 0])).float())
+    return features, final_logits
+
+
+def fit_exits(model, features, labels, epochs, lr=1e-3, batch_size=256):
+    """Train each exit classifier on frozen backbone features"""
+    for layer, layer_features in features.items():
+        exit_classifier = model.exits[str(layer)]
+        x = torch.cat(layer_features)
+        y = torch.cat([torch.full((len(f),), label) for f, label in zip(layer_features, labels)])
+        optimizer = torch.optim.Adam(exit_classifier.parameters(), lr=lr)
+        for epoch in range(epochs):
+            order = torch.randperm(len(x))
+            total = 0.0
+            for start in range(0, len(x), batch_size):
+                idx = order[start:start + batch_size]
+                loss = F.cross_entropy(exit_classifier(x[idx]), y[idx])
+                optimizer.zero_grad()
+                loss.backward()
+                optimizer.step()
+                total += loss.item() * len(idx)
+            print(f"exit {layer} epoch {epoch + 1}: loss {total / len(x):.3f}")
+
+
+def fit_thresholds(model, features, final_preds, labels, agreement, min_exits):
+    """
+    Cascade over the exits in order. Each exit gets the lowest margin
+    threshold at which the samples it would take (among those no earlier
+    exit took) agree with the full model at least `agreement` of the time
+    """
+    remaining = torch.ones(len(final_preds), dtype=torch.bool)
+    report = []
+    with torch.no_grad():
+        for layer in sorted(features):
+            exit_classifier = model.exits[str(layer)]
+            margins, preds = [], []
+            for f in features[layer]:
+                logits = exit_classifier(f)
+                margins.append(softmax_margin(logits).item())
+                preds.append(F.softmax(logits, dim=-1).mean(dim=0).argmax().item())
+            margins, preds = torch.tensor(margins), torch.tensor(preds)
+
+            candidates = remaining.nonzero().flatten()
+            order = candidates[margins[candidates].argsort(descending=True)]
+            agree = (preds[order] == final_preds[order]).float()
+            running_agreement = agree.cumsum(0) / torch.arange(1, len(order) + 1)
+            ok = (running_agreement >= agreement).nonzero().flatten()
+            ok = ok[ok + 1 >= min_exits]
+
+            if len(ok) == 0:
+                exit_classifier.threshold.fill_(float('inf'))
+                report.append((layer, float('inf'), 0, float('nan'), float('nan')))
+                continue
+
+            taken = order[:ok[-1] + 1]
+            exit_classifier.threshold.fill_(margins[taken].min().item())
+            remaining[taken] = False
+            report.append((
+                layer, exit_classifier.threshold.item(), len(taken),
+                (preds[taken] == final_preds[taken]).float().mean().item(),
+                (preds[taken] == labels[taken]).float().mean().item(),
+            ))
+    return report
+
+
+def time_model(model, batches, early_exit):
+    """Model time over all batches, predictions and blocks run"""
+    preds, depths = [], []
+    elapsed = 0.0
+    with torch.no_grad(), precision_context(model):
+        for keypoints, valid_keypoints in batches:
+            start = time.perf_counter()
+            if early_exit:
+                logits, depth = model.forward_early_exit(keypoints, valid_keypoints)
+            else:
+                logits, depth = model.heads[model.exit_head](model(keypoints, valid_keypoints)), len(model.blocks)
+            elapsed += time.perf_counter() - start
+            preds.append(F.softmax(logits.float(), dim=-1).mean(dim=0).argmax().item())
+            depths.append(depth)
+    return torch.tensor(preds), torch.tensor(depths, dtype=torch.float32), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checkpoint', default='./models/big_model.pth')
+    parser.add_argument('--precision', default='fp32')
+    parser.add_argument('--split', required=True, help='held-out VideoDataset split csv (file, width, height, idx)')
+    parser.add_argument('--keypoints-path', required=True)
+    parser.add_argument('--train-split', help='split used to train the exit classifiers, if given')
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--layers', nargs='+', type=int, default=[2, 3, 4], help='exit after these blocks (0-indexed)')
+    parser.add_argument('--agreement', type=float, default=0.98, help='required agreement with the full model')
+    parser.add_argument('--min-exits', type=int, default=5)
+    parser.add_argument('--samples', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='./models/early_exit.pt')
+    args = parser.parse_args()
+
+    model = build_model(args.checkpoint, precision=args.precision)
+    model.add_early_exits(args.layers)
+    keep_float32_outside_blocks(model)
+
+    if args.train_split:
+        train_samples = load_keypoint_files(args.train_split, args.keypoints_path)
+        train_labels = pd.read_csv(args.train_split)['idx'].tolist()
+        train_features, _ = collect_features(model, tta_batches(train_samples, args.samples, args.seed), args.layers)
+        fit_exits(model, train_features, train_labels, args.epochs)
+        del train_features
+
+    samples = load_keypoint_files(args.split, args.keypoints_path)
+    labels = torch.tensor(pd.read_csv(args.split)['idx'].tolist())
+    batches = list(tta_batches(samples, args.samples, args.seed))
+    features, final_logits = collect_features(model, batches, args.layers)
+    final_preds = torch.stack([F.softmax(l, dim=-1).mean(dim=0) for l in final_logits]).argmax(dim=-1)
+
+    report = fit_thresholds(model, features, final_preds, labels, args.agreement, args.min_exits)
+    print(f"{'exit':>4} {'threshold':>9} {'exits':>6} {'agree':>6} {'acc':>6}")
+    for layer, threshold, count, agree, acc in report:
+        print(f"{layer:>4} {threshold:>9.3f} {count:>6} {agree:>6.3f} {acc:>6.3f}")
+
+    full_preds, full_depths, full_time = time_model(model, batches, early_exit=False)
+    exit_preds, exit_depths, exit_time = time_model(model, batches, early_exit=True)
+    full_acc = (full_preds == labels).float().mean().item()
+    exit_acc = (exit_preds == labels).float().mean().item()
+    print(f"Full model:  top-1 {full_acc:.3f}, {full_depths.mean():.2f} blocks, {full_time:.2f} s")
+    print(f"Early exit:  top-1 {exit_acc:.3f}, {exit_depths.mean():.2f} blocks, {exit_time:.2f} s")
+    print(f"Saved {1 - exit_time / full_time:.1%} of model time for {exit_acc - full_acc:+.3f} top-1")
+
+    save_early_exits(model, args.output)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
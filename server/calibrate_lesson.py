@@ -0,0 +1,109 @@
+"""
+Fit the lesson verification temperature and accept threshold on a held-out
+keypoint set.
+
+Every clip is scored twice, as /verify-sign/ would: once with its own class
+as the lesson target, and once as an impostor against a similar class (a
+random one of its nearest distractors). The temperature minimizes the
+binary cross-entropy of the target score over both, so a score reads as
+the probability that the clip is the target sign. The threshold is the
+lowest score whose impostor accept rate stays under --false-accept.
+Writes both for LESSON_CALIBRATION.
+
+    python calibrate_lesson.py --split val.csv --keypoints-path keypoints/
+    python calibrate_lesson.py --split val.csv --keypoints-path keypoints/ --false-accept 0.02 --samples 8
+"""
+import argparse
+
+import pandas as pd
+import torch
+import torch.nn.functional as F
+
+from inference import SLRClassifier, build_model
+from lesson import LessonScorer, save_lesson_calibration
+from parity_check import load_keypoint_files
+from tta import build_tta_batch
+from VideoDataset import get_selected_keypoints
+
+
+def collect_logits(scorer, samples, labels, sample_amount, seed):
+    """Slice logits of every clip against its own class and against a similar impostor class"""
+    generator = torch.Generator().manual_seed(seed)
+    genuine, impostor = [], []
+    for i, ((name, pose, height, width), label) in enumerate(zip(samples, labels)):
+        keypoints, valid_keypoints = build_tta_batch(
+            pose, get_selected_keypoints(), sample_amount,
+            height=height, width=width, seed=seed + i
+        )
+        if keypoints is None:
+            continue
+        rows = scorer.lesson_slice([label])[0]
+        other = rows[1 + torch.randint(len(rows) - 1, (1,), generator=generator)].item()
+        genuine.append(scorer.slice_logits([label], keypoints, valid_keypoints))
+        impostor.append(scorer.slice_logits([other], keypoints, valid_keypoints))
+    return genuine, impostor
+
+
+def target_scores(scorer, logits):
+    return torch.stack([scorer.probabilities(l)[0] for l in logits])
+
+
+def fit_temperature(scorer, genuine, impostor, temperatures):
+    """Temperature with the lowest binary cross-entropy of the target score"""
+    targets = torch.cat([torch.ones(len(genuine)), torch.zeros(len(impostor))])
+    losses = []
+    for temperature in temperatures:
+        scorer.temperature = temperature.item()
+        scores = torch.cat([target_scores(scorer, genuine), target_scores(scorer, impostor)])
+        losses.append(F.binary_cross_entropy(scores.clamp(1e-6, 1 - 1e-6), targets).item())
+    best = min(range(len(losses)), key=losses.__getitem__)
+    scorer.temperature = temperatures[best].item()
+    return scorer.temperature, losses[best]
+
+
+def fit_threshold(impostor_scores, false_accept):
+    """Lowest threshold (scores >= it pass) whose impostor accept rate is at most false_accept"""
+    ranked = impostor_scores.sort(descending=True).values
+    allowed = int(false_accept * len(ranked))
+    if allowed >= len(ranked):
+        return 0.0
+    return min(1.0, ranked[allowed].item() + 1e-6)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checkpoint', default='./models/big_model.pth')
+    parser.add_argument('--precision', default='fp32')
+    parser.add_argument('--split', required=True, help='held-out VideoDataset split csv (file, width, height, idx)')
+    parser.add_argument('--keypoints-path', required=True)
+    parser.add_argument('--n-distractors', type=int, default=64)
+    parser.add_argument('--false-accept', type=float, default=0.05, help='allowed impostor accept rate')
+    parser.add_argument('--samples', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='./models/lesson_calibration.pt')
+    args = parser.parse_args()
+
+    classifier = SLRClassifier(build_model(args.checkpoint, precision=args.precision)).eval()
+    scorer = LessonScorer(classifier, {}, n_distractors=args.n_distractors)
+
+    samples = load_keypoint_files(args.split, args.keypoints_path)
+    labels = pd.read_csv(args.split)['idx'].tolist()
+    genuine, impostor = collect_logits(scorer, samples, labels, args.samples, args.seed)
+
+    uncalibrated = (target_scores(scorer, genuine), target_scores(scorer, impostor))
+    temperature, loss = fit_temperature(scorer, genuine, impostor, torch.logspace(-2, 1, 121))
+    genuine_scores, impostor_scores = target_scores(scorer, genuine), target_scores(scorer, impostor)
+    threshold = fit_threshold(impostor_scores, args.false_accept)
+
+    print(f"{len(genuine)} clips, temperature {temperature:.3f}, BCE {loss:.3f}")
+    print(f"{'':>14} {'genuine':>8} {'impostor':>8} {'accepted':>9} {'false acc':>9}")
+    for name, (g, i), t in (('uncalibrated', uncalibrated, 0.5), ('calibrated', (genuine_scores, impostor_scores), threshold)):
+        print(f"{name:>14} {g.mean():>8.3f} {i.mean():>8.3f} {(g >= t).float().mean():>9.3f} {(i >= t).float().mean():>9.3f}")
+    print(f"Accept threshold {threshold:.3f}")
+
+    save_lesson_calibration(args.output, temperature, threshold, args.n_distractors)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
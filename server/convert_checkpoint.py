@@ -0,0 +1,56 @@
+"""
+One-time conversion of a training checkpoint into a lean inference checkpoint.
+
+Strips the torch.compile() '_orig_mod.' prefix, keeps only the classification
+heads that are served and writes the result in torch's zip format so the
+server can memory-map it (SLR_CHECKPOINT=<output>).
+
+    python convert_checkpoint.py
+    python convert_checkpoint.py --input ./models/big_model.pth --output ./models/big_model_asl_citizen.pt --heads asl_citizen
+"""
+import argparse
+import os
+
+import torch
+
+from inference import CHECKPOINT_FORMAT, MODEL_CONFIG, load_converted_model, strip_compiled_prefix
+
+
+def convert(input_path, output_path, heads):
+    unknown = [name for name in heads if name not in MODEL_CONFIG['n_cls_dict']]
+    if unknown:
+        raise ValueError(f"Unknown heads {unknown}, expected some of {list(MODEL_CONFIG['n_cls_dict'])}")
+
+    state_dict = torch.load(input_path, map_location='cpu')
+    state_dict = strip_compiled_prefix(state_dict)
+
+    dropped = [name for name in MODEL_CONFIG['n_cls_dict'] if name not in heads]
+    state_dict = {
+        key: value.contiguous() for key, value in state_dict.items()
+        if not any(key.startswith(f'heads.{name}.') for name in dropped)
+    }
+
+    config = dict(MODEL_CONFIG)
+    config['n_cls_dict'] = {name: MODEL_CONFIG['n_cls_dict'][name] for name in heads}
+    checkpoint = {'format': CHECKPOINT_FORMAT, 'config': config, 'state_dict': state_dict}
+
+    # Fails on missing or unexpected keys before anything is written
+    load_converted_model(checkpoint)
+
+    torch.save(checkpoint, output_path)
+    print(f"Dropped heads {dropped}")
+    print(f"Wrote {output_path}: {os.path.getsize(input_path) / 1024**2:.0f} MB -> "
+          f"{os.path.getsize(output_path) / 1024**2:.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input', default='./models/big_model.pth')
+    parser.add_argument('--output', default='./models/big_model_asl_citizen.pt')
+    parser.add_argument('--heads', nargs='+', default=['asl_citizen'])
+    args = parser.parse_args()
+    convert(args.input, args.output, args.heads)
+
+
+if __name__ == "__main__":
+    main()
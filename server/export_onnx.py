@@ -0,0 +1,84 @@
+"""
+Export SLR plus one classification head to an ONNX graph with a dynamic batch
+dimension, for serving with SLR_BACKEND=onnx. The head weights are saved
+next to the graph (.head.pt) for lesson scoring.
+
+    python export_onnx.py
+    python export_onnx.py --checkpoint ./models/big_model.pth --output ./models/slr_asl_citizen.onnx
+"""
+import argparse
+import time
+
+import torch
+
+from inference import OnnxClassifier, SLRClassifier, build_model, onnx_head_path
+
+
+def export(classifier, output_path, max_len, n_keypoints, opset=18):
+    batch = torch.export.Dim('batch', min=1, max=256)
+    keypoints = torch.randn(2, max_len, n_keypoints, 3)
+    valid_keypoints = torch.rand(2, max_len, n_keypoints) > 0.2
+    torch.onnx.export(
+        classifier,
+        (keypoints, valid_keypoints),
+        output_path,
+        input_names=['keypoints', 'valid_keypoints'],
+        output_names=['logits'],
+        dynamic_shapes=({0: batch}, {0: batch}),
+        opset_version=opset,
+        dynamo=True,
+    )
+
+
+def check_parity(classifier, output_path, max_len, n_keypoints, batch_size=16):
+    """Compare ONNX Runtime logits to eager PyTorch on a random batch"""
+    keypoints = torch.randn(batch_size, max_len, n_keypoints, 3)
+    valid_keypoints = torch.rand(batch_size, max_len, n_keypoints) > 0.2
+
+    with torch.no_grad():
+        start = time.perf_counter()
+        expected = classifier(keypoints, valid_keypoints)
+        eager_time = time.perf_counter() - start
+
+    session = OnnxClassifier(output_path)
+    session(keypoints, valid_keypoints)  # warm up
+    start = time.perf_counter()
+    actual = session(keypoints, valid_keypoints)
+    onnx_time = time.perf_counter() - start
+
+    max_diff = (expected - actual).abs().max().item()
+    top1 = (expected.argmax(-1) == actual.argmax(-1)).float().mean().item()
+    print(f"Max abs logit diff {max_diff:.2e}, top-1 agreement {top1:.3f}")
+    print(f"Batch of {batch_size}: eager {eager_time * 1000:.0f} ms, onnxruntime {onnx_time * 1000:.0f} ms")
+    return max_diff < 1e-3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checkpoint', default='./models/big_model.pth')
+    parser.add_argument('--output', default='./models/slr_asl_citizen.onnx')
+    parser.add_argument('--head', default='asl_citizen')
+    parser.add_argument('--opset', type=int, default=18)
+    parser.add_argument('--skip-check', action='store_true')
+    args = parser.parse_args()
+
+    model = build_model(args.checkpoint, precision='fp32')
+    classifier = SLRClassifier(model, args.head).eval()
+
+    export(classifier, args.output, model.max_len, model.n_keypoints, opset=args.opset)
+    print(f"Exported {args.head} classifier to {args.output}")
+
+    # Lesson scoring picks its distractor rows from the head weights
+    weight, bias = classifier.head_parameters()
+    torch.save({
+        'weight': weight.detach().clone(),
+        'bias': bias.detach().clone() if bias is not None else None,
+    }, onnx_head_path(args.output))
+    print(f"Saved head weights to {onnx_head_path(args.output)}")
+
+    if not args.skip_check and not check_parity(classifier, args.output, model.max_len, model.n_keypoints):
+        raise SystemExit("ONNX output does not match eager PyTorch")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+import contextlib
+import os
+import pickle
+import zipfile
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.ao.quantization import quantize_dynamic
+
+from model import SLR
+
+# Architecture of ./models/big_model.pth
+MODEL_CONFIG = dict(
+    n_embd=16*64,
+    n_cls_dict={'asl_citizen':2305, 'lsfb': 4657, 'wlasl':2000, 'autsl':226, 'rsl':1001},
+    n_head=16,
+    n_layer=6,
+    n_keypoints=63,
+    dropout=0.6,
+    max_len=64,
+    bias=True
+)
+
+# fp32: eager float32 (reference)
+# int8: dynamic INT8 quantization of the Linear layers inside the transformer blocks
+# bf16: bfloat16 Linear weights in the transformer blocks, run under CPU autocast
+PRECISIONS = ('fp32', 'int8', 'bf16')
+
+
+# Tag written by convert_checkpoint.py
+CHECKPOINT_FORMAT = 'slr-inference-v1'
+
+
+def strip_compiled_prefix(state_dict):
+    """Remove the '_orig_mod.' prefix that torch.compile() adds to every key"""
+    if not any(key.startswith('_orig_mod.') for key in state_dict.keys()):
+        return state_dict
+    print("Detected compiled model, fixing key names...")
+    new_state_dict = {}
+    for key, value in state_dict.items():
+        if key.startswith('_orig_mod.'):
+            new_key = key[10:]  # Remove '_orig_mod.' prefix
+            new_state_dict[new_key] = value
+        else:
+            new_state_dict[key] = value
+    return new_state_dict
+
+
+# Load the compiled model weights and fix the key names
+def load_compiled_model_weights(model, checkpoint_path):
+    """Load weights from a torch.compile() saved model"""
+    try:
+        # Load the state dict
+        state_dict = torch.load(checkpoint_path, map_location=torch.device('cpu'))
+        state_dict = strip_compiled_prefix(state_dict)
+
+        # Load the cleaned state dict
+        model.load_state_dict(state_dict, strict=False)
+        print("Model weights loaded successfully!")
+        return model
+
+    except Exception as e:
+        print(f"Error loading model: {e}")
+        # Try alternative loading methods
+        try:
+            # Method 2: Load with strict=False
+            state_dict = torch.load(checkpoint_path, map_location=torch.device('cpu'))
+            model.load_state_dict(state_dict, strict=False)
+            print("Model loaded with strict=False")
+            return model
+        except Exception as e2:
+            print(f"Alternative loading also failed: {e2}")
+            raise e
+
+
+def read_converted_checkpoint(checkpoint_path):
+    """
+    Memory-map a checkpoint written by convert_checkpoint.py.
+    Returns None for a checkpoint in another format (e.g. the original
+    big_model.pth); a missing or unreadable file raises
+    """
+    if not os.path.exists(checkpoint_path):
+        raise FileNotFoundError(f"Checkpoint {checkpoint_path} not found")
+    # Converted checkpoints are always in torch's zip format, which mmap needs
+    if not zipfile.is_zipfile(checkpoint_path):
+        return None
+    try:
+        checkpoint = torch.load(checkpoint_path, map_location='cpu', mmap=True, weights_only=True)
+    except pickle.UnpicklingError:
+        # Holds more than tensors and plain containers, not a converted checkpoint
+        return None
+    if not isinstance(checkpoint, dict) or checkpoint.get('format') != CHECKPOINT_FORMAT:
+        return None
+    return checkpoint
+
+
+def load_converted_model(checkpoint):
+    """
+    Build SLR directly on top of the memory-mapped weights. The module is
+    created on the meta device so no random init is allocated, and the
+    weights are assigned rather than copied, so worker processes share the
+    same page-cache pages
+    """
+    with torch.device('meta'):
+        model = SLR(**checkpoint['config'])
+    model.load_state_dict(checkpoint['state_dict'], strict=True, assign=True)
+    print(f"Memory-mapped model weights with heads {list(model.heads.keys())}")
+    return model
+
+
+def bf16_supported():
+    """True if oneDNN has native bf16 kernels on this CPU (AVX512-BF16 / AMX)"""
+    try:
+        return torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except Exception:
+        return False
+
+
+def apply_precision(model, precision):
+    """
+    Convert the transformer blocks of an eval-mode SLR to the given precision.
+    The tokenizer, layernorms and heads stay in float32
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', expected one of {PRECISIONS}")
+
+    if precision == 'int8':
+        model.blocks = quantize_dynamic(model.blocks, {nn.Linear}, dtype=torch.qint8)
+    elif precision == 'bf16':
+        if not bf16_supported():
+            print("Warning: CPU has no native bf16 support, bf16 inference will be slow")
+        for module in model.blocks.modules():
+            if isinstance(module, nn.Linear):
+                module.to(torch.bfloat16)
+
+    model.precision = precision
+    keep_float32_outside_blocks(model)
+    return model
+
+
+def run_in_float32(module, method='forward'):
+    """Make module.<method> run in float32 with autocast disabled, even inside a bf16 autocast region"""
+    wrapped = module.__dict__.setdefault('float32_methods', set())
+    if method in wrapped:
+        return
+    call = getattr(module, method)
+
+    def float32_call(*args, **kwargs):
+        with torch.autocast('cpu', enabled=False):
+            args = [arg.float() if torch.is_tensor(arg) and arg.is_floating_point() else arg for arg in args]
+            return call(*args, **kwargs)
+
+    setattr(module, method, float32_call)
+    wrapped.add(method)
+
+
+def keep_float32_outside_blocks(model):
+    """
+    Under bf16 autocast, keep the tokenizer matmuls (single and multi-window),
+    heads and exit classifiers in float32; only the transformer blocks run in bf16
+    """
+    if getattr(model, 'precision', 'fp32') != 'bf16':
+        return
+    for module in [model.tokenizer, *model.heads.values(), *model.exits.values()]:
+        run_in_float32(module)
+    if hasattr(model.tokenizer, 'window_tokens'):
+        run_in_float32(model.tokenizer, 'window_tokens')
+
+
+def precision_context(model):
+    """Autocast context required to run a model prepared by apply_precision"""
+    if getattr(model, 'precision', 'fp32') == 'bf16':
+        return torch.autocast('cpu', dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+def weight_bytes(model):
+    """Size of the model weights in bytes, including packed quantized weights"""
+    def tensor_bytes(value):
+        if isinstance(value, torch.Tensor):
+            return value.numel() * value.element_size()
+        if isinstance(value, (tuple, list)):
+            return sum(tensor_bytes(v) for v in value)
+        return 0
+    return sum(tensor_bytes(v) for v in model.state_dict().values())
+
+
+def build_model(checkpoint_path='./models/big_model.pth', precision='fp32'):
+    checkpoint = read_converted_checkpoint(checkpoint_path)
+    if checkpoint is not None:
+        model = load_converted_model(checkpoint)
+    else:
+        model = SLR(**MODEL_CONFIG)
+        model = load_compiled_model_weights(model, checkpoint_path)
+    model.eval()
+    return apply_precision(model, precision)
+
+
+def save_early_exits(model, path):
+    """Save calibrated exit classifiers and thresholds (see calibrate_early_exit.py)"""
+    torch.save({
+        'head': model.exit_head,
+        'layers': [int(layer) for layer in model.exits.keys()],
+        'state_dict': model.exits.state_dict(),
+    }, path)
+
+
+def load_early_exits(model, path):
+    artifact = torch.load(path, map_location='cpu', weights_only=True)
+    model.add_early_exits(artifact['layers'], artifact['head'])
+    model.exits.load_state_dict(artifact['state_dict'])
+    keep_float32_outside_blocks(model)
+    thresholds = {layer: round(exit_classifier.threshold.item(), 3) for layer, exit_classifier in model.exits.items()}
+    print(f"Early exit enabled after blocks {thresholds}")
+    return model
+
+
+class SLRClassifier(nn.Module):
+    """
+    SLR backbone plus a single classification head.
+    Maps keypoints (B, T, K, 3) and valid (B, T, K) to float32 logits (B, n_classes)
+    """
+
+    def __init__(self, model, head='asl_citizen'):
+        super(SLRClassifier, self).__init__()
+        self.model = model
+        self.head = head
+
+    @property
+    def uses_early_exit(self):
+        return len(self.model.exits) > 0 and self.head == self.model.exit_head
+
+    @property
+    def supports_micro_batching(self):
+        # forward_early_exit decides on the whole batch at once
+        return not self.uses_early_exit
+
+    def forward(self, keypoints, valid_keypoints):
+        with precision_context(self.model):
+            if self.uses_early_exit:
+                logits, _ = self.model.forward_early_exit(keypoints, valid_keypoints)
+            else:
+                logits = self.model.heads[self.head](self.model(keypoints, valid_keypoints))
+        return logits.float()
+
+    def features(self, keypoints, valid_keypoints):
+        """Backbone output (B, n_embd) before the head"""
+        with precision_context(self.model):
+            return self.model(keypoints, valid_keypoints).float()
+
+    def head_parameters(self):
+        """Weight (n_classes, n_embd) and bias of the served head"""
+        head = self.model.heads[self.head]
+        return head.weight, head.bias
+
+    def forward_windows(self, keypoints, valid_keypoints, indices):
+        """Logits for each window of one video, see SLR.forward_windows"""
+        with precision_context(self.model):
+            logits = self.model.heads[self.head](self.model.forward_windows(keypoints, valid_keypoints, indices))
+        return logits.float()
+
+
+def onnx_head_path(onnx_path):
+    """Where export_onnx.py saves the head weights next to a graph"""
+    return os.path.splitext(onnx_path)[0] + '.head.pt'
+
+
+class OnnxClassifier:
+    """
+    Same interface as SLRClassifier, served by ONNX Runtime from a graph
+    written by export_onnx.py
+    """
+
+    def __init__(self, onnx_path, num_threads=4):
+        # onnxruntime is only needed for this backend
+        import onnxruntime as ort
+
+        session_options = ort.SessionOptions()
+        session_options.intra_op_num_threads = num_threads
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            onnx_path, session_options, providers=['CPUExecutionProvider']
+        )
+        self.onnx_path = onnx_path
+
+        # Head weights saved next to the graph, for lesson scoring
+        self.head = None
+        if os.path.exists(onnx_head_path(onnx_path)):
+            self.head = torch.load(onnx_head_path(onnx_path), map_location='cpu', weights_only=True)
+
+    def head_parameters(self):
+        """Weight and bias of the head in the graph, None if export_onnx.py didn't save them"""
+        if self.head is None:
+            return None
+        return self.head['weight'], self.head['bias']
+
+    def __call__(self, keypoints, valid_keypoints):
+        logits, = self.session.run(None, {
+            'keypoints': keypoints.numpy().astype(np.float32, copy=False),
+            'valid_keypoints': valid_keypoints.numpy().astype(np.bool_, copy=False),
+        })
+        return torch.from_numpy(logits)
+
+
+# torch: eager PyTorch module built from the checkpoint
+# onnx: ONNX Runtime session over an exported graph
+BACKENDS = ('torch', 'onnx')
+
+
+def build_classifier(backend='torch', checkpoint_path='./models/big_model.pth', precision='fp32',
+                     onnx_path='./models/slr_asl_citizen.onnx', head='asl_citizen',
+                     early_exit_path=None):
+    if backend == 'onnx':
+        return OnnxClassifier(onnx_path)
+    if backend != 'torch':
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+    model = build_model(checkpoint_path, precision)
+    if early_exit_path:
+        load_early_exits(model, early_exit_path)
+    return SLRClassifier(model, head).eval()
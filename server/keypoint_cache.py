@@ -0,0 +1,143 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+
+class KeypointCache:
+    """
+    Content-addressed cache of extracted keypoints, keyed by a hash of the
+    uploaded video bytes and the extraction settings.
+
+    Entries are dicts with the extracted `pose` (T, K, 3), a boolean
+    `extracted` mask (T,) of the frames MediaPipe actually ran on (demand-
+    driven extraction leaves the others at -1), `height`, `width` and the
+    trimmed `span`. The in-memory tier is an LRU of `memory_items` entries;
+    the disk tier keeps compressed .npz files under `disk_path`, evicting the
+    least recently used once they exceed `disk_bytes`. disk_bytes=0 turns
+    the disk tier off
+    """
+
+    def __init__(self, memory_items=32, disk_path=None, disk_bytes=512 * 1024**2):
+        self.memory_items = memory_items
+        self.disk_path = disk_path if disk_bytes > 0 else None
+        self.disk_bytes = disk_bytes
+        self.memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.partial_hits = 0
+        if self.disk_path:
+            os.makedirs(self.disk_path, exist_ok=True)
+
+    @staticmethod
+    def key(contents, *settings):
+        """sha256 of the video bytes plus anything that changes what extraction returns"""
+        digest = hashlib.sha256(contents)
+        digest.update(repr(settings).encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return self.memory[key]
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, entry)
+        return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._remember(key, entry)
+        self._write_disk(key, entry)
+
+    def record_partial_hit(self):
+        """A hit that still had to extract frames the cached entry was missing"""
+        with self._lock:
+            self.partial_hits += 1
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "partial_hits": self.partial_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0,
+            "memory_entries": len(self.memory),
+        }
+
+    def _remember(self, key, entry):
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.disk_path, key + '.npz')
+
+    def _read_disk(self, key):
+        if not self.disk_path or not os.path.exists(self._path(key)):
+            return None
+        try:
+            with np.load(self._path(key)) as data:
+                height, width, start, end = data['meta'].tolist()
+                entry = {
+                    'pose': torch.from_numpy(data['pose']),
+                    'extracted': torch.from_numpy(data['extracted']),
+                    'height': height,
+                    'width': width,
+                    'span': [start, end],
+                }
+            # Mark as recently used for eviction
+            os.utime(self._path(key))
+            return entry
+        except Exception as e:
+            print(f"Keypoint cache read error: {e}")
+            return None
+
+    def _write_disk(self, key, entry):
+        if not self.disk_path:
+            return
+        try:
+            # Written under a temporary name so readers never see a partial file
+            tmp_path = self._path(key) + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.savez_compressed(
+                    f,
+                    pose=entry['pose'].numpy(),
+                    extracted=entry['extracted'].numpy(),
+                    meta=np.array([entry['height'], entry['width'], *entry['span']]),
+                )
+            os.replace(tmp_path, self._path(key))
+            self._evict_disk()
+        except Exception as e:
+            print(f"Keypoint cache write error: {e}")
+
+    def _evict_disk(self):
+        files = []
+        for name in os.listdir(self.disk_path):
+            if name.endswith('.npz'):
+                stat = os.stat(os.path.join(self.disk_path, name))
+                files.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.disk_path, name))
+                total -= size
+            except OSError:
+                pass
@@ -0,0 +1,113 @@
+from collections import OrderedDict
+
+import torch
+import torch.nn.functional as F
+
+
+def build_gloss_index(gloss_info):
+    """Map lower-cased words and glosses from gloss.csv to class indices"""
+    gloss_to_idx = {}
+    for i in range(len(gloss_info)):
+        idx = int(gloss_info['idx'][i])
+        gloss_to_idx[str(gloss_info['word'][i]).lower()] = idx
+        gloss_to_idx[str(gloss_info['gloss'][i]).lower()] = idx
+    return gloss_to_idx
+
+
+def save_lesson_calibration(path, temperature, threshold, n_distractors):
+    """Save a temperature and accept threshold fitted by calibrate_lesson.py"""
+    torch.save({
+        'temperature': float(temperature),
+        'threshold': float(threshold),
+        'n_distractors': int(n_distractors),
+    }, path)
+
+
+def load_lesson_calibration(path):
+    """LessonScorer keyword arguments from a file written by save_lesson_calibration()"""
+    return torch.load(path, map_location='cpu', weights_only=True)
+
+
+class LessonScorer:
+    """
+    Restricted-vocabulary scoring for the learning module.
+
+    A lesson is a small set of target classes. Its slice of the head is the
+    target rows plus `n_distractors` rows of the classes whose head weights
+    are closest to the targets, i.e. the signs a learner is most likely to be
+    confused with. Scores are a softmax over that slice only, so a clip of a
+    different but similar sign pulls the target score down instead of the
+    target winning by default. Slices are cached per lesson.
+
+    Both backends score the same rows: the eager model evaluates only the
+    sliced head, ONNX graphs return full logits that are cut to those rows.
+    Logits are divided by `temperature` before the softmax. With the
+    defaults (1.0, 0.5) scores are uncalibrated; calibrate_lesson.py fits
+    both on held-out clips.
+    """
+
+    def __init__(self, classifier, gloss_to_idx, n_distractors=64, cache_size=128,
+                 temperature=1.0, threshold=0.5):
+        self.classifier = classifier
+        self.gloss_to_idx = gloss_to_idx
+        self.n_distractors = n_distractors
+        self.cache_size = cache_size
+        self.temperature = temperature
+        self.threshold = threshold
+        self.cache = OrderedDict()
+
+    def resolve(self, glosses):
+        """Class indices for the given words/glosses, raises KeyError on unknown ones"""
+        unknown = [g for g in glosses if g.strip().lower() not in self.gloss_to_idx]
+        if unknown:
+            raise KeyError(f"Unknown glosses: {', '.join(unknown)}")
+        return sorted({self.gloss_to_idx[g.strip().lower()] for g in glosses})
+
+    def lesson_slice(self, targets):
+        """(rows, sliced head weight, sliced head bias) for a tuple of target indices"""
+        key = tuple(targets)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        head = self.classifier.head_parameters()
+        if head is None:
+            raise RuntimeError("Lesson scoring needs the head weights, re-run export_onnx.py to save them")
+        weight, bias = head
+        with torch.no_grad():
+            normed = F.normalize(weight.float(), dim=-1)
+            similarity = (normed[list(targets)] @ normed.T).max(dim=0).values
+            similarity[list(targets)] = float('-inf')
+            n_distractors = min(self.n_distractors, len(similarity) - len(targets))
+            distractors = similarity.topk(n_distractors).indices
+            rows = torch.cat([torch.tensor(targets), distractors])
+            sliced = (weight[rows].detach().clone(), bias[rows].detach().clone() if bias is not None else None)
+
+        self.cache[key] = (rows, *sliced)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return self.cache[key]
+
+    def slice_logits(self, targets, keypoints, valid_keypoints):
+        """Logits (S, len(targets) + n_distractors) of a TTA batch over the lesson's rows, targets first"""
+        rows, weight, bias = self.lesson_slice(targets)
+        with torch.no_grad():
+            features = getattr(self.classifier, 'features', None)
+            if features is None:
+                # ONNX graphs only return full logits, keep the same rows of them
+                return self.classifier(keypoints, valid_keypoints)[:, rows].float()
+            features = features(keypoints, valid_keypoints)
+            return F.linear(features, weight.to(features.dtype),
+                            bias.to(features.dtype) if bias is not None else None).float()
+
+    def probabilities(self, logits):
+        """Softmax of slice logits at the scorer's temperature, averaged over samples"""
+        return F.softmax(logits / self.temperature, dim=-1).mean(dim=0)
+
+    def score(self, targets, keypoints, valid_keypoints):
+        """
+        Per-target probabilities for a TTA batch, averaged over samples.
+        Returns {class index: probability}
+        """
+        probs = self.probabilities(self.slice_logits(targets, keypoints, valid_keypoints))
+        return {idx: probs[i].item() for i, idx in enumerate(targets)}
@@ -0,0 +1,84 @@
+from collections import deque
+
+import cv2
+import numpy as np
+import torch
+
+from VideoLoader import LandmarkerSet
+
+
+def decode_frame(data, size=None):
+    """
+    One frame of a live stream as (H, W, 3) uint8 RGB, flipped vertically
+    like the uploaded videos. `data` is an encoded image (JPEG, PNG), or raw
+    RGB24 bytes when the (height, width) `size` is given. None if it can't
+    be decoded
+    """
+    if not data:
+        return None
+    if size is not None:
+        height, width = size
+        if len(data) != height * width * 3:
+            return None
+        frame = np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3)
+    else:
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return None
+        frame = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    return frame[::-1]
+
+
+class LiveSession:
+    """
+    Continuous recognition over a live frame stream, one per connection.
+
+    Every frame is landmarked once, as it arrives, by the session's own
+    LandmarkerSet in VIDEO mode, so tracking carries over from frame to
+    frame. Its keypoints join a sliding window of the last `window` frames,
+    which is due for classification once full and then every `hop` frames.
+    A word is emitted when its probability reaches `threshold`, and is not
+    emitted again until a window is below the threshold or predicts a
+    different word.
+    """
+
+    def __init__(self, extractor, window=64, hop=16, fps=15, threshold=0.5):
+        self.extractor = extractor
+        self.hop = hop
+        self.fps = fps
+        self.threshold = threshold
+        self.keypoints = deque(maxlen=window)
+        self.frames = 0
+        self.height = self.width = None
+        self.last_word = None
+        self.landmarkers = LandmarkerSet(extractor.plan)
+        self.landmarkers.start_sequence()
+
+    def push(self, frame):
+        """Extract one frame. Returns True when the window is due for classification"""
+        self.height, self.width = frame.shape[0], frame.shape[1]
+        self.keypoints.append(self.extractor.extract_frame(self.landmarkers, frame, self.frames, self.fps))
+        self.frames += 1
+        window = self.keypoints.maxlen
+        return self.frames >= window and (self.frames - window) % self.hop == 0
+
+    def window(self):
+        """Keypoints (window, K, 3) of the frames in the window"""
+        return torch.from_numpy(np.stack(self.keypoints))
+
+    def update(self, probs):
+        """
+        Class probabilities (n_classes,) of the latest window. Returns
+        (class index, probability) of a newly confident word, or None
+        """
+        prob, idx = probs.max(dim=0)
+        if prob.item() < self.threshold:
+            self.last_word = None
+            return None
+        if idx.item() == self.last_word:
+            return None
+        self.last_word = idx.item()
+        return idx.item(), prob.item()
+
+    def close(self):
+        self.landmarkers.close()
@@ -39,11 +39,13 @@ os.environ['MALLOC_MMAP_THRESHOLD_'] = '131072'
 os.environ['TOKENIZERS_PARALLELISM'] = 'false'
 
 from datetime import datetime
-from functools import lru_cache
+import itertools
+import json
 import tempfile
 import threading
 import asyncio
-from fastapi import FastAPI, File, UploadFile, HTTPException, Request
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request, Query, WebSocket, WebSocketDisconnect
+from typing import List, Optional
 from fastapi.middleware.cors import CORSMiddleware
 import cv2
 import numpy as np 
@@ -52,9 +54,20 @@ import aiohttp
 import pandas as pd
 #import torch
 import whisper
-from VideoLoader import KeypointExtractor, read_video
-from VideoDataset import process_keypoints
-from model import SLR
+from VideoLoader import (
+    ExtractionPlan, ExtractionPool, KeypointExtractor, LandmarkerPool, UploadBuffer, VideoDecoder,
+    active_span, prefetch,
+)
+from inference import build_classifier, weight_bytes
+from tta import (
+    build_tta_batch, build_window_batch, frames_needed, run_adaptive_tta, run_windows,
+    tta_indices, window_indices,
+)
+from batching import MicroBatcher
+from lesson import LessonScorer, build_gloss_index, load_lesson_calibration
+from keypoint_cache import KeypointCache
+from live import LiveSession, decode_frame
+from VideoDataset import get_selected_keypoints
 from pydantic import BaseModel
 import shutil
 import uvicorn
@@ -64,8 +77,6 @@ import warnings
 warnings.filterwarnings("ignore")
 
 # Torch settings for memory safety
-import torch._dynamo
-torch._dynamo.config.suppress_errors = True
 torch.set_num_threads(4)  # Reasonable PyTorch threading
 
 app = FastAPI()
@@ -108,100 +119,170 @@ with mediapipe_lock:
 # Load other models
 whisper_model = whisper.load_model("tiny")
 
-model = SLR(
-    n_embd=16*64, 
-    n_cls_dict={'asl_citizen':2305, 'lsfb': 4657, 'wlasl':2000, 'autsl':226, 'rsl':1001},
-    n_head=16, 
-    n_layer=6,
-    n_keypoints=63,
-    dropout=0.6, 
-    max_len=64,
-    bias=True
+# Serve the SLR model from eager PyTorch (torch, default) or from a graph
+# written by export_onnx.py (onnx)
+model_backend = os.environ.get("SLR_BACKEND", "torch").lower()
+# Inference precision for the eager model: fp32 (default), int8 or bf16.
+# SLR_CHECKPOINT can point at a file written by convert_checkpoint.py, which
+# only holds the served head and is memory-mapped instead of read into RAM
+model_precision = os.environ.get("SLR_PRECISION", "fp32").lower()
+classifier = build_classifier(
+    model_backend,
+    checkpoint_path=os.environ.get("SLR_CHECKPOINT", "./models/big_model.pth"),
+    precision=model_precision,
+    onnx_path=os.environ.get("SLR_ONNX_PATH", "./models/slr_asl_citizen.onnx"),
+    # Exit classifiers written by calibrate_early_exit.py (torch backend only)
+    early_exit_path=os.environ.get("SLR_EARLY_EXIT"),
+)
+if model_backend == 'torch':
+    print(f"SLR model running in {model_precision} ({weight_bytes(classifier) / 1024**2:.0f} MB of weights)")
+else:
+    print(f"SLR model served by ONNX Runtime from {classifier.onnx_path}")
+
+# Requests arriving within SLR_BATCH_WAIT_MS of each other share one forward,
+# up to SLR_MAX_BATCH augmented samples
+batcher = MicroBatcher(
+    classifier,
+    max_batch_size=int(os.environ.get("SLR_MAX_BATCH", 64)),
+    max_wait_ms=float(os.environ.get("SLR_BATCH_WAIT_MS", 8)),
 )
-
-# Load the compiled model weights and fix the key names
-def load_compiled_model_weights(model, checkpoint_path):
-    """Load weights from a torch.compile() saved model"""
-    try:
-        # Load the state dict
-        state_dict = torch.load(checkpoint_path, map_location=torch.device('cpu'))
-        
-        # Check if this is a compiled model (has _orig_mod prefix)
-        if any(key.startswith('_orig_mod.') for key in state_dict.keys()):
-            print("Detected compiled model, fixing key names...")
-            # Remove the _orig_mod. prefix from all keys
-            new_state_dict = {}
-            for key, value in state_dict.items():
-                if key.startswith('_orig_mod.'):
-                    new_key = key[10:]  # Remove '_orig_mod.' prefix
-                    new_state_dict[new_key] = value
-                else:
-                    new_state_dict[key] = value
-            state_dict = new_state_dict
-        
-        # Load the cleaned state dict
-        model.load_state_dict(state_dict, strict=False)
-        print("Model weights loaded successfully!")
-        return model
-        
-    except Exception as e:
-        print(f"Error loading model: {e}")
-        # Try alternative loading methods
-        try:
-            # Method 2: Load with strict=False
-            state_dict = torch.load(checkpoint_path, map_location=torch.device('cpu'))
-            model.load_state_dict(state_dict, strict=False)
-            print("Model loaded with strict=False")
-            return model
-        except Exception as e2:
-            print(f"Alternative loading also failed: {e2}")
-            raise e
-
-# Load the model with the fixed function
-model = load_compiled_model_weights(model, './models/big_model.pth')
-model.eval()
 
 gloss_info = pd.read_csv('./gloss.csv')
 idx_to_word = {}
 for i in range(len(gloss_info)):
     idx_to_word[gloss_info['idx'][i]] = gloss_info['word'][i]
 
-@lru_cache(maxsize=1)
-def get_selected_keypoints():
-    selected_keypoints = list(range(42)) 
-    selected_keypoints = selected_keypoints + [x + 42 for x in ([291, 267, 37, 61, 84, 314, 310, 13, 80, 14] + [152])]
-    selected_keypoints = selected_keypoints + [x + 520 for x in ([2, 5, 7, 8, 11, 12, 13, 14, 15, 16])]
-    return selected_keypoints
+# Lesson verification scores a clip against a few target glosses only.
+# LESSON_CALIBRATION points at the temperature and accept threshold written
+# by calibrate_lesson.py; without it scores are uncalibrated
+lesson_calibration_path = os.environ.get("LESSON_CALIBRATION", "./models/lesson_calibration.pt")
+lesson_calibration = {}
+if os.path.exists(lesson_calibration_path):
+    lesson_calibration = load_lesson_calibration(lesson_calibration_path)
+    print(f"Lesson scores calibrated from {lesson_calibration_path} {lesson_calibration}")
+else:
+    print("Lesson scores are uncalibrated, see calibrate_lesson.py")
+lesson_scorer = LessonScorer(classifier, build_gloss_index(gloss_info), **lesson_calibration)
+
+# Extracted keypoints of recently uploaded videos, so retries and replays of
+# the same bytes skip decoding and MediaPipe. KEYPOINT_CACHE_MB=0 keeps it in memory only
+keypoint_cache = KeypointCache(
+    memory_items=int(os.environ.get("KEYPOINT_CACHE_ITEMS", 32)),
+    disk_path=os.environ.get("KEYPOINT_CACHE_DIR", "./keypoint_cache"),
+    disk_bytes=int(os.environ.get("KEYPOINT_CACHE_MB", 512)) * 1024**2,
+)
+
+# Test-time augmentation sample counts
+DEFAULT_TTA_SAMPLES = 16
+MAX_TTA_SAMPLES = 64
+
+# Only the keypoints the model reads are extracted. MEDIAPIPE_SKIP_FACE=1
+# also skips the face landmarker, leaving the face keypoints missing
+# MEDIAPIPE_BACKEND=holistic runs one holistic graph per frame instead of
+# separate pose, gesture and face tasks (compare with benchmark_extraction.py)
+extraction_plan = ExtractionPlan(
+    get_selected_keypoints(),
+    skip_face=os.environ.get("MEDIAPIPE_SKIP_FACE", "0") == "1",
+    backend=os.environ.get("MEDIAPIPE_BACKEND", "tasks").lower(),
+)
+print(f"Extracting {extraction_plan.describe()}")
+
+# MediaPipe landmarkers are built once at startup and reused across videos.
+# MEDIAPIPE_POOL_SIZE sets how many videos can be extracted concurrently
+landmarker_pool = LandmarkerPool(size=int(os.environ.get("MEDIAPIPE_POOL_SIZE", 2)), plan=extraction_plan)
 
 # Thread-safe keypoint extractor
 keypoint_extractor = None
 extractor_lock = threading.Lock()
 
+# MEDIAPIPE_STRIDE > 1 runs the landmarkers on about 1 in STRIDE frames,
+# picked by motion, and interpolates the rest
+extraction_stride = float(os.environ.get("MEDIAPIPE_STRIDE", 1))
+
+# MEDIAPIPE_DEMAND_FRAMES=1 draws the TTA frame indices before extraction and
+# runs MediaPipe only on the frames they read; off by default, since it saves
+# little at 16 samples and its effect on accuracy hasn't been measured.
+# MEDIAPIPE_STRIDE then applies within those frames.
+# MEDIAPIPE_CONTEXT_FRAMES adds that many preceding frames to each, so the
+# hand and face trackers see the motion leading into every frame they read
+demand_frames = os.environ.get("MEDIAPIPE_DEMAND_FRAMES", "0") == "1"
+context_frames = int(os.environ.get("MEDIAPIPE_CONTEXT_FRAMES", 2))
+
+# MEDIAPIPE_ROI_SIZE crops hands and face around the pose and downscales the
+# crops to that many pixels before the hand and face models (unset: full frames)
+roi_size = int(os.environ["MEDIAPIPE_ROI_SIZE"]) if os.environ.get("MEDIAPIPE_ROI_SIZE") else None
+
+# Uploads are decoded from memory. When the frames to extract are known up
+# front (no trimming, or a cached span) MediaPipe runs on each frame as it is
+# decoded and the whole video is never held; MEDIAPIPE_STREAM=0 always decodes it first
+stream_frames = os.environ.get("MEDIAPIPE_STREAM", "1") == "1"
+
+# DECODE_MAX_SIZE scales frames down to that many pixels on the longer side
+# and DECODE_FPS drops frames down to that rate, both inside the decoder
+# (0: off). Keypoints are still reported in original-resolution pixels
+decode_max_size = int(os.environ.get("DECODE_MAX_SIZE", 0)) or None
+decode_fps = float(os.environ.get("DECODE_FPS", 0)) or None
+
+# /recognize-sign-from-stream/ rejects request bodies over STREAM_UPLOAD_MAX_MB,
+# and fails uploads that send nothing for STREAM_UPLOAD_TIMEOUT seconds
+stream_upload_max_bytes = int(os.environ.get("STREAM_UPLOAD_MAX_MB", 200)) * 1024**2
+stream_upload_timeout = float(os.environ.get("STREAM_UPLOAD_TIMEOUT", 30))
+
+# /recognize-sign-live/ classifies the last 64 frames every LIVE_HOP frames by default.
+# Every session holds its own landmarkers; connections past LIVE_MAX_SESSIONS
+# concurrent sessions are closed right away
+default_live_hop = int(os.environ.get("LIVE_HOP", 16))
+live_sessions = asyncio.Semaphore(int(os.environ.get("LIVE_MAX_SESSIONS", 4)))
+
+# MEDIAPIPE_WORKERS > 0 splits each video over that many worker processes,
+# each with its own landmarkers, instead of extracting it on one thread
+extraction_workers = int(os.environ.get("MEDIAPIPE_WORKERS", 0))
+
 def get_keypoint_extractor():
     global keypoint_extractor
     with extractor_lock:
         if keypoint_extractor is None:
-            keypoint_extractor = KeypointExtractor()
+            processes = None
+            if extraction_workers > 0:
+                processes = ExtractionPool(workers=extraction_workers, plan=extraction_plan, roi_size=roi_size)
+                processes.warm()
+            keypoint_extractor = KeypointExtractor(pool=landmarker_pool, processes=processes,
+                                                   plan=extraction_plan, stride=extraction_stride,
+                                                   roi_size=roi_size)
         return keypoint_extractor
 
 @app.post("/recognize-sign-from-video/")
-async def recognize_sign_from_video(file: UploadFile = File(...)):
+async def recognize_sign_from_video(
+    file: UploadFile = File(...),
+    samples: int = Query(DEFAULT_TTA_SAMPLES, ge=1, le=MAX_TTA_SAMPLES),
+    seed: Optional[int] = Query(None),
+    windows: bool = Query(False),
+    adaptive: bool = Query(False),
+    min_samples: int = Query(4, ge=1, le=MAX_TTA_SAMPLES),
+    trim: bool = Query(True),
+):
     """
-    Memory-safe video processing with proper resource management
+    Memory-safe video processing with proper resource management.
+    `samples` sets the number of augmented TTA samples, `seed` fixes the
+    augmentation RNG for reproducible results. `windows` replaces the
+    augmented samples with `samples` deterministic temporal windows that
+    share one per-frame tokenizer pass. `adaptive` draws augmented samples a
+    few at a time and stops between `min_samples` and `samples` once the
+    prediction is stable. `trim` cuts idle frames before and after the sign;
+    the kept frame span is returned as `trim`
     """
     if not file:
         raise HTTPException(status_code=400, detail="No video file provided")
     
-    temp_path = None
     try:
-        # Create temporary file
-        with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as tmp:
-            contents = await file.read()
-            tmp.write(contents)
-            temp_path = tmp.name
+        # Decoded straight from the uploaded bytes
+        contents = await file.read()
         
         # Process video with memory safety
-        result = await process_video_safe(temp_path)
+        result = await process_video_safe(
+            contents, sample_amount=samples, seed=seed, windows=windows,
+            adaptive=adaptive, min_samples=min_samples, trim=trim
+        )
         return result
         
     except HTTPException:
@@ -210,95 +291,299 @@ async def recognize_sign_from_video(file: UploadFile = File(...)):
         print(f"Unexpected error: {e}")
         raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
     finally:
-        # Cleanup
-        if temp_path and os.path.exists(temp_path):
+        # Force cleanup
+        gc.collect()
+
+@app.post("/recognize-sign-from-stream/")
+async def recognize_sign_from_stream(
+    request: Request,
+    samples: int = Query(DEFAULT_TTA_SAMPLES, ge=1, le=MAX_TTA_SAMPLES),
+    seed: Optional[int] = Query(None),
+    windows: bool = Query(False),
+    adaptive: bool = Query(False),
+    min_samples: int = Query(4, ge=1, le=MAX_TTA_SAMPLES),
+    trim: bool = Query(False),
+):
+    """
+    /recognize-sign-from-video/ for a raw video request body (plain or
+    chunked transfer encoding) that is decoded while it uploads, so a slow
+    uplink overlaps with decoding and extraction instead of adding to them.
+    Keypoints are extracted as frames arrive for faststart MP4 (or WebM)
+    uploads with trim=false, the default here; with `trim` only decoding
+    overlaps the upload. Send Content-Length when it is known, without it
+    MP4 can't start before the upload completes. An upload that stalls for
+    STREAM_UPLOAD_TIMEOUT seconds fails with 408
+    """
+    content_length = request.headers.get("content-length")
+    upload = UploadBuffer(size=int(content_length) if content_length else None,
+                          max_bytes=stream_upload_max_bytes, timeout=stream_upload_timeout)
+    task = asyncio.ensure_future(process_video_safe(
+        upload, sample_amount=samples, seed=seed, windows=windows,
+        adaptive=adaptive, min_samples=min_samples, trim=trim
+    ))
+    
+    too_large = stalled = None
+    chunks = request.stream().__aiter__()
+    try:
+        while not task.done():
+            # Stop receiving if the processing failed before the upload ended
             try:
-                os.remove(temp_path)
-            except:
-                pass
+                chunk = await asyncio.wait_for(chunks.__anext__(), stream_upload_timeout)
+            except StopAsyncIteration:
+                break
+            upload.feed(chunk)
+        upload.finish()
+    except asyncio.TimeoutError:
+        stalled = TimeoutError(f"Upload stalled, nothing received for {stream_upload_timeout:g} s")
+        upload.finish(error=stalled)
+    except ValueError as e:
+        too_large = e
+        upload.finish(error=e)
+    except Exception as e:
+        # The client went away; the decoder sees the error
+        upload.finish(error=e)
+    
+    try:
+        return await task
+    except Exception as e:
+        if too_large is not None:
+            raise HTTPException(status_code=413, detail=str(too_large))
+        if stalled is not None or isinstance(e, TimeoutError):
+            raise HTTPException(status_code=408, detail=str(stalled or e))
+        print(f"Unexpected error: {e}")
+        raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
+    finally:
         # Force cleanup
         gc.collect()
 
-async def process_video_safe(video_path: str):
+def pose_cache_key(video_bytes, trim):
+    """Keypoint cache key of an upload under the current extraction settings"""
+    return keypoint_cache.key(
+        video_bytes, trim, extraction_plan.keypoints, extraction_plan.backend, extraction_stride,
+        roi_size, demand_frames and context_frames, decode_max_size, decode_fps
+    )
+
+async def extract_pose_safe(video_source, index_sampler=None, trim: bool = False):
     """
-    Process video with comprehensive memory management
+    Decode an uploaded video from memory and extract its keypoints.
+    `video_source` is the uploaded bytes, or an UploadBuffer that is decoded
+    while the upload is still arriving. With `trim`, idle frames before and
+    after the signing are cut first. `index_sampler(num_frames)` returns the
+    (S, 64) frame indices the model will read; with demand-driven extraction
+    only those frames are extracted and the rest stay -1. Results are cached
+    under a hash of the video bytes.
+    Returns pose (T, 553, 3), height, width, the sampled indices (or None)
+    and the [start, end) frame span that was kept
     """
     video = None
-    pose = None
+    decoder = None
+    loop = asyncio.get_event_loop()
+    
+    # A streamed upload's hash is only known once it is complete
+    uploading = isinstance(video_source, UploadBuffer)
+    cache_key = None
+    cached = None
+    if not uploading:
+        # Hashing the upload and reading the disk tier stay off the event loop
+        cache_key = await loop.run_in_executor(None, pose_cache_key, video_source, trim)
+        cached = await loop.run_in_executor(None, keypoint_cache.get, cache_key)
     
     try:
-        # Read video
-        video = read_video(video_path)
-        if video is None:
-            raise ValueError("Could not read video file")
-            
-        # Preprocess video
-        video = video.permute(0, 3, 1, 2) / 255.0
-        video = torch.flip(video, dims=[-2])
-        
-        print(f"Processing video with shape: {video.shape}")
+        indices = None
+        if cached is not None:
+            indices = index_sampler(len(cached['pose'])) if index_sampler else None
+            missing = missing_frames(cached['extracted'], indices)
+            if not missing:
+                print(f"Keypoint cache hit, {len(cached['pose'])} frames")
+                pose = extraction_plan.expand(cached['pose'])
+                return pose, cached['height'], cached['width'], indices, cached['span']
+            keypoint_cache.record_partial_hit()
         
         # Get extractor (thread-safe)
         extractor = get_keypoint_extractor()
+        # Opening reads the container header, which may still be uploading
+        decoder = await loop.run_in_executor(
+            None, lambda: VideoDecoder(video_source, max_size=decode_max_size, fps=decode_fps)
+        )
+        span = cached['span'] if cached is not None else None
+        pose = None
         
-        # Extract keypoints with single-threaded processing to avoid memory corruption
-        try:
-            # Use the safe sequential extractor (no parallel processing)
-            pose = await asyncio.get_event_loop().run_in_executor(
-                None, 
-                lambda: extractor.extract_safe_parallel(video)
+        # Frames go from the decoder straight into MediaPipe when which ones to
+        # keep is known before decoding: untrimmed, or trimmed to a cached span
+        if stream_frames and extraction_stride <= 1 and extraction_workers == 0 and (span or not trim):
+            num_frames = span[1] - span[0] if span else decoder.num_frames
+            frames = None
+            if cached is not None:
+                # Only what the cached entry doesn't have yet
+                frames = missing
+                print(f"Keypoint cache partial hit, extracting {len(frames)} more frames")
+            elif num_frames and index_sampler:
+                indices = index_sampler(num_frames)
+                if demand_frames:
+                    frames = frames_needed(indices, context=context_frames)
+                    print(f"Extracting {len(frames)} of {num_frames} frames read by the samples")
+            
+            stream = itertools.islice(decoder, span[0], span[1]) if span else decoder
+            keep = set(frames) if frames is not None else None
+            size = (decoder.height, decoder.width) if decoder.height else None
+            pose, height, width = await loop.run_in_executor(
+                None,
+                lambda: extractor.extract_stream(prefetch(stream), keep=keep, size=size)
             )
-        except Exception as e:
-            print(f"Keypoint extraction failed: {e}")
-            raise ValueError("Failed to extract keypoints from video")
+            decoder.close()
+            
+            if num_frames and len(pose) != num_frames:
+                # The samples were drawn for the wrong length, decode again
+                print(f"Decoded {len(pose)} frames, expected {num_frames}; extracting from the full video")
+                pose = None
+                if uploading:
+                    video_source = await loop.run_in_executor(None, video_source.getvalue)
+                decoder = VideoDecoder(video_source, max_size=decode_max_size, fps=decode_fps)
+            else:
+                span = span or [0, len(pose)]
+                if indices is None and index_sampler:
+                    indices = index_sampler(len(pose))
+        
+        if pose is None:
+            # Trimming and motion-based frame selection need the whole video
+            video = await loop.run_in_executor(None, decoder.read_all)
+            
+            # Cheap motion pre-pass, so idle lead-in/out never reaches MediaPipe
+            if span:
+                video = video[span[0]:span[1]]
+            elif trim:
+                span = list(active_span(video))
+                video = video[span[0]:span[1]]
+                print(f"Trimmed to frames {span[0]}-{span[1]}")
+            else:
+                span = [0, len(video)]
+            
+            print(f"Processing video with shape: {video.shape}")
+            
+            frames = None
+            if cached is not None:
+                # Only what the cached entry doesn't have yet
+                frames = missing
+                print(f"Keypoint cache partial hit, extracting {len(frames)} more frames")
+            else:
+                indices = index_sampler(len(video)) if index_sampler else None
+                if indices is not None and demand_frames:
+                    frames = frames_needed(indices, context=context_frames)
+                    print(f"Extracting {len(frames)} of {len(video)} frames read by the samples")
+            
+            # Keypoints in original pixels, frames may have been downscaled while decoding
+            height, width = decoder.height, decoder.width
+            
+            # Extract keypoints with single-threaded processing to avoid memory corruption
+            try:
+                # Use the safe sequential extractor (no parallel processing)
+                pose = await loop.run_in_executor(
+                    None, 
+                    lambda: extractor.extract_safe_parallel(video, frames=frames, size=(height, width))
+                )
+            except Exception as e:
+                print(f"Keypoint extraction failed: {e}")
+                raise ValueError("Failed to extract keypoints from video")
         
         if pose is None or len(pose) == 0:
             raise ValueError("No keypoints extracted from video")
-            
-        height, width = video.shape[-2], video.shape[-1]
         
-        print("Video shape:", video.shape)
+        if uploading and not torch.all(pose == -1):
+            # Extraction read the whole upload, the endpoint finishes it right after
+            cache_key = await loop.run_in_executor(
+                None, lambda: pose_cache_key(video_source.getvalue(), trim)
+            )
+        
+        if cache_key is not None and not torch.all(pose == -1):
+            extracted = torch.ones(len(pose), dtype=torch.bool)
+            if frames is not None:
+                extracted = torch.zeros(len(pose), dtype=torch.bool)
+                extracted[frames] = True
+            if cached is not None:
+                # Merge the new frames into the cached ones
+                pose = torch.where(extracted.view(-1, 1, 1), pose, cached['pose'])
+                extracted |= cached['extracted']
+            # Compressed and written to disk in the background, the response doesn't wait
+            loop.run_in_executor(None, keypoint_cache.put, cache_key, {
+                'pose': pose, 'extracted': extracted,
+                'height': height, 'width': width, 'span': span,
+            })
+        
+        # Back into the 553 layout process_keypoints indexes
+        pose = extraction_plan.expand(pose)
+        
         print("Pose shape:", pose.shape)
         print("Pose sample (frame 0):", pose[0][:5] if len(pose) > 0 else "Empty")
         
+        return pose, height, width, indices, span
+        
+    finally:
+        if decoder is not None:
+            decoder.close()
+        del video
+        gc.collect()
+
+def missing_frames(extracted, indices):
+    """Frames the samples need (all frames without indices) that a cached entry lacks"""
+    if indices is None or not demand_frames:
+        needed = range(len(extracted))
+    else:
+        needed = frames_needed(indices, context=context_frames)
+    return [frame for frame in needed if not extracted[frame]]
+
+async def process_video_safe(video_source, sample_amount: int = DEFAULT_TTA_SAMPLES,
+                             seed: Optional[int] = None, windows: bool = False,
+                             adaptive: bool = False, min_samples: int = 4, trim: bool = True):
+    """
+    Process video with comprehensive memory management
+    """
+    pose = None
+    
+    # The frames every sample reads are fixed before extraction
+    if windows:
+        index_sampler = lambda num_frames: window_indices(num_frames, 64, sample_amount)
+    else:
+        index_sampler = lambda num_frames: tta_indices(num_frames, sample_amount, seed=seed)
+    
+    try:
+        pose, height, width, sampled, span = await extract_pose_safe(
+            video_source, index_sampler, trim=trim
+        )
+        
         # Process keypoints for model
         selected_keypoints = get_selected_keypoints()
-        sample_amount = 16  # Reduced further for memory safety
         
-        logits = None
+        if windows:
+            # Deterministic overlapping windows sharing the per-frame spatial tokens
+            keypoints, valid_keypoints, indices = build_window_batch(
+                pose, selected_keypoints, sample_amount, height=height, width=width, indices=sampled
+            )
+        else:
+            # All augmented samples go through the model as a single batch
+            keypoints, valid_keypoints = build_tta_batch(
+                pose, selected_keypoints, sample_amount,
+                height=height, width=width, seed=seed, indices=sampled
+            )
+            if keypoints is None:
+                raise ValueError("No valid keypoints for model inference")
+        
         try:
-            with torch.no_grad():
-                model.eval()
-                
-                for i in range(sample_amount):
-                    keypoints, valid_keypoints = process_keypoints(
-                        pose, 64, selected_keypoints, 
-                        height=height, width=width, augment=True
-                    )
-                    
-                    if keypoints.numel() == 0:
-                        continue
-                    
-                    # Single batch inference
-                    batch_logits = model.heads['asl_citizen'](
-                        model(keypoints.unsqueeze(0), valid_keypoints.unsqueeze(0))
-                    )
-                    
-                    if logits is None:
-                        logits = batch_logits
-                    else:
-                        logits = logits + batch_logits
-                    
-                    # Clear intermediate tensors
-                    del keypoints, valid_keypoints, batch_logits
-                    
+            if windows:
+                logits = await batcher.run(run_windows, classifier, keypoints, valid_keypoints, indices)
+                samples_used = len(indices)
+            elif adaptive:
+                logits, samples_used = await run_adaptive_tta(
+                    batcher.submit, keypoints, valid_keypoints, min_samples=min_samples
+                )
+            else:
+                logits = (await batcher.submit(keypoints, valid_keypoints)).mean(dim=0)
+                samples_used = len(keypoints)
+            del keypoints, valid_keypoints
+            
         except Exception as e:
             print(f"Model inference error: {e}")
             raise ValueError(f"Model inference failed: {str(e)}")
         
-        if logits is None:
-            raise ValueError("No valid keypoints for model inference")
-        
         # Get prediction
         try:
             top_idx = torch.argmax(logits).item()  # Get index of maximum value
@@ -307,13 +592,161 @@ async def process_video_safe(video_path: str):
             print(f"Prediction error: {e}")
             top_word = "UNKNOWN"
         
-        return {"recognized_word": top_word}
+        return {"recognized_word": top_word, "samples_used": samples_used, "trim": span}
         
     finally:
         # Explicit cleanup
-        del video, pose
+        del pose
         gc.collect()
 
+@app.post("/verify-sign/")
+async def verify_sign(
+    file: UploadFile = File(...),
+    targets: List[str] = Query(...),
+    samples: int = Query(8, ge=1, le=MAX_TTA_SAMPLES),
+    seed: Optional[int] = Query(None),
+    threshold: Optional[float] = Query(None, ge=0.0, le=1.0),
+    trim: bool = Query(True),
+):
+    """
+    Lesson verification: did the user perform one of the `targets` glosses?
+    Only the lesson's rows of the head are evaluated. Returns per-target
+    scores, the best target and whether it passed `threshold` (by default
+    the calibrated one)
+    """
+    if not file:
+        raise HTTPException(status_code=400, detail="No video file provided")
+    
+    try:
+        target_indices = lesson_scorer.resolve(targets)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e.args[0]))
+    
+    pose = None
+    try:
+        contents = await file.read()
+        
+        pose, height, width, sampled, span = await extract_pose_safe(
+            contents, lambda num_frames: tta_indices(num_frames, samples, seed=seed), trim=trim
+        )
+        keypoints, valid_keypoints = build_tta_batch(
+            pose, get_selected_keypoints(), samples,
+            height=height, width=width, seed=seed, indices=sampled
+        )
+        if keypoints is None:
+            raise ValueError("No valid keypoints for model inference")
+        
+        scores = await batcher.run(lesson_scorer.score, target_indices, keypoints, valid_keypoints)
+        scores = {idx_to_word.get(idx, "UNKNOWN"): round(score, 4) for idx, score in scores.items()}
+        best = max(scores, key=scores.get)
+        
+        return {
+            "scores": scores,
+            "best_match": best,
+            "accepted": scores[best] >= (threshold if threshold is not None else lesson_scorer.threshold),
+            "trim": span,
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
+    finally:
+        del pose
+        gc.collect()
+
+@app.websocket("/recognize-sign-live/")
+async def recognize_sign_live(
+    websocket: WebSocket,
+    hop: int = Query(default_live_hop, ge=1, le=64),
+    fps: float = Query(15, gt=0),
+    samples: int = Query(4, ge=1, le=MAX_TTA_SAMPLES),
+    threshold: float = Query(0.5, ge=0.0, le=1.0),
+    seed: int = Query(0),
+):
+    """
+    Continuous recognition over a live camera stream. Send each frame as a
+    binary message, JPEG or PNG encoded, or raw RGB24 after a text message
+    {"width": w, "height": h}; `fps` is the rate frames are sent at. Frames
+    are landmarked as they arrive and the last 64 are classified every
+    `hop` frames. Words are pushed as {"word", "confidence", "frame"} once
+    their probability reaches `threshold`. Past LIVE_MAX_SESSIONS concurrent
+    sessions the socket is closed with code 1013 (try again later)
+    """
+    await websocket.accept()
+    if live_sessions.locked():
+        await websocket.close(code=1013, reason="Too many live sessions")
+        return
+    
+    async with live_sessions:
+        await run_live_session(websocket, hop, fps, samples, threshold, seed)
+
+async def run_live_session(websocket, hop, fps, samples, threshold, seed):
+    """Receive frames and push words until the client disconnects"""
+    loop = asyncio.get_event_loop()
+    extractor = get_keypoint_extractor()
+    session = await loop.run_in_executor(
+        None, lambda: LiveSession(extractor, window=64, hop=hop, fps=fps, threshold=threshold)
+    )
+    raw_size = None
+    pending = None
+    
+    async def classify(pose, height, width, frame):
+        keypoints, valid_keypoints = build_tta_batch(
+            extraction_plan.expand(pose), get_selected_keypoints(), samples,
+            height=height, width=width, seed=seed
+        )
+        if keypoints is None:
+            return
+        logits = await batcher.submit(keypoints, valid_keypoints)
+        word = session.update(torch.softmax(logits.float(), dim=-1).mean(dim=0))
+        if word is not None:
+            idx, confidence = word
+            await websocket.send_json({
+                "word": idx_to_word.get(idx, "UNKNOWN"),
+                "confidence": round(confidence, 4),
+                "frame": frame,
+            })
+    
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("text"):
+                try:
+                    config = json.loads(message["text"])
+                    raw_size = (int(config["height"]), int(config["width"]))
+                except (ValueError, KeyError, TypeError):
+                    await websocket.send_json({"error": "Expected {\"width\": w, \"height\": h}"})
+                continue
+            
+            frame = decode_frame(message.get("bytes") or b"", raw_size)
+            if frame is None:
+                await websocket.send_json({"error": "Could not decode frame"})
+                continue
+            
+            if await loop.run_in_executor(None, session.push, frame):
+                # One classification in flight per session, frames keep coming meanwhile
+                if pending is not None:
+                    await pending
+                pending = asyncio.ensure_future(
+                    classify(session.window(), session.height, session.width, session.frames - 1)
+                )
+    
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"Live recognition error: {e}")
+    finally:
+        if pending is not None:
+            try:
+                await pending
+            except Exception:
+                pass
+        await loop.run_in_executor(None, session.close)
+
 @app.get("/test-sign-recognition/{video_filename}")
 async def test_sign_recognition(video_filename: str, request: Request):
     """
@@ -335,7 +768,7 @@ async def test_sign_recognition(video_filename: str, request: Request):
                            filename=video_filename,
                            content_type='video/mp4')
             
-            async with session.post(url, data=data) as response:
+            async with session.post(url, data=data, params=dict(request.query_params)) as response:
                 if response.status == 200:
                     return await response.json()
                 else:
@@ -350,13 +783,8 @@ async def recognize_gesture(file: UploadFile = File(...)):
     if not file:
         raise HTTPException(status_code=400, detail="No file uploaded")
     
-    temp_path = None
     try:
-        with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as tmp:
-            contents = await file.read()
-            tmp.write(contents)
-            temp_path = tmp.name
-
+        contents = await file.read()
         np_arr = np.frombuffer(contents, np.uint8)
         image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
         
@@ -368,12 +796,6 @@ async def recognize_gesture(file: UploadFile = File(...)):
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.remove(temp_path)
-            except:
-                pass
 
     return {"gesture": detected_gesture}
 
@@ -430,7 +852,9 @@ def health_check():
         "status": "healthy",
         "cpu_percent": psutil.cpu_percent(),
         "memory_percent": psutil.virtual_memory().percent,
-        "available_memory_gb": round(psutil.virtual_memory().available / (1024**3), 2)
+        "available_memory_gb": round(psutil.virtual_memory().available / (1024**3), 2),
+        "inference_batching": batcher.stats(),
+        "keypoint_cache": keypoint_cache.stats()
     }
 
 @app.get("/")
@@ -118,7 +118,116 @@ class Tokenizer(nn.Module):
         temporal_scale = (self.max_len + 1) / (temporal_valid_counts + 1)
         embeddings[:, T:, :] *= temporal_scale.transpose(1, 2)  # match dims
 
-        return self.relu(embeddings) 
+        return self.relu(embeddings)
+
+class FusedTokenizer(Tokenizer):
+    """
+    Drop-in replacement for Tokenizer that computes all spatial and temporal
+    tokens with one matmul each instead of looping over the per-keypoint and
+    per-frame Linear layers. Parameters are the same ModuleLists, so existing
+    state dicts load unchanged. The stacked weights are built once and
+    reused until the parameters are reloaded or moved; while gradients are
+    needed they are rebuilt every call so they stay in the graph.
+    """
+
+    def __init__(self, n_embd, n_keypoints, max_len):
+        super(FusedTokenizer, self).__init__(n_embd, n_keypoints, max_len)
+        self._stacked = {}
+        self.register_load_state_dict_post_hook(lambda module, incompatible_keys: module._stacked.clear())
+
+    def _apply(self, fn, *args, **kwargs):
+        self._stacked.clear()
+        return super(FusedTokenizer, self)._apply(fn, *args, **kwargs)
+
+    def stacked(self, name):
+        """
+        Weight (L*3, n_embd) and bias (L, n_embd) of the L Linear layers in
+        fcs_spatial or fcs_temporal, stacked for one matmul
+        """
+        layers = getattr(self, name)
+        needs_grad = torch.is_grad_enabled() and layers[0].weight.requires_grad
+        if name in self._stacked and not needs_grad:
+            return self._stacked[name]
+        weight = torch.stack([fc.weight for fc in layers]).transpose(1, 2).reshape(-1, self.n_embd)
+        bias = torch.stack([fc.bias for fc in layers])
+        if needs_grad:
+            return weight, bias
+        self._stacked[name] = (weight.detach(), bias.detach())
+        return self._stacked[name]
+
+    def spatial_tokens(self, keypoints, valid):
+        """
+        One token per frame, (B, T, n_embd). Each depends only on its own
+        frame, so they can be computed once per video and shared between
+        temporal windows
+        """
+        B, T, n_keypoints, _ = keypoints.shape
+        valid = valid.to(keypoints.dtype)
+        w_spatial, b_spatial = self.stacked('fcs_spatial')
+
+        # sum_k valid[t, k] * (W_k x[t, k] + b_k)
+        masked = keypoints * valid.unsqueeze(-1)
+        spatial = masked.reshape(B, T, -1) @ w_spatial + valid @ b_spatial
+        spatial_valid_counts = valid.sum(dim=-1, keepdim=True)  # (B, T, 1)
+        spatial = spatial * ((self.n_keypoints + 1) / (spatial_valid_counts + 1))
+        return self.relu(spatial)
+
+    def temporal_tokens(self, keypoints, valid):
+        """One token per keypoint over the window, (B, n_keypoints, n_embd)"""
+        B, T, n_keypoints, _ = keypoints.shape
+        valid = valid.to(keypoints.dtype)
+        # The first T frames' layers are the first T * 3 rows
+        w_temporal, b_temporal = self.stacked('fcs_temporal')
+        w_temporal, b_temporal = w_temporal[:T * 3], b_temporal[:T]
+
+        # sum_t valid[t, k] * (W_t x[t, k] + b_t)
+        masked = keypoints * valid.unsqueeze(-1)
+        temporal = masked.transpose(1, 2).reshape(B, self.n_keypoints, -1) @ w_temporal
+        temporal = temporal + valid.transpose(1, 2) @ b_temporal
+        temporal_valid_counts = valid.sum(dim=-2).unsqueeze(-1)  # (B, n_keypoints, 1)
+        temporal = temporal * ((self.max_len + 1) / (temporal_valid_counts + 1))
+        return self.relu(temporal)
+
+    def forward(self, keypoints, valid):
+        B, T, n_keypoints, _ = keypoints.shape
+        assert keypoints.shape[-2] == self.n_keypoints
+        assert valid.shape[-1] == self.n_keypoints
+
+        return torch.cat([
+            self.spatial_tokens(keypoints, valid),
+            self.temporal_tokens(keypoints, valid),
+        ], dim=1)
+
+    def window_tokens(self, keypoints, valid, indices):
+        """
+        Tokens (S, T+n_keypoints, n_embd) of several windows of one video.
+        keypoints (N, n_keypoints, 3) and valid (N, n_keypoints) hold every
+        frame, indices (S, T) picks the frames of each window. Spatial tokens
+        are computed once per frame and gathered for each window
+        """
+        spatial = self.spatial_tokens(keypoints.unsqueeze(0), valid.unsqueeze(0))[0]
+        return torch.cat([
+            spatial[indices],
+            self.temporal_tokens(keypoints[indices], valid[indices]),
+        ], dim=1)
+
+def softmax_margin(logits):
+    """Top-1 minus top-2 probability of the batch-averaged softmax"""
+    probs = F.softmax(logits.float(), dim=-1).mean(dim=0)
+    top2 = probs.topk(2).values
+    return top2[0] - top2[1]
+
+class ExitClassifier(nn.Module):
+    """Layernorm + linear head on the cls token of an intermediate block"""
+
+    def __init__(self, n_embd, n_classes):
+        super(ExitClassifier, self).__init__()
+        self.layernorm = LayerNorm(n_embd, bias=False)
+        self.head = nn.Linear(n_embd, n_classes, bias=False)
+        self.register_buffer('threshold', torch.tensor(float('inf')))
+
+    def forward(self, x):
+        return self.head(self.layernorm(x))
 
 class WordProjection(nn.Module):
     def __init__(self, word_embd, n_embd):
@@ -149,7 +258,8 @@ class SLR(nn.Module):
             n_keypoints=63,
             dropout=0.0, 
             max_len=64,
-            bias=True
+            bias=True,
+            fused_tokenizer=True
         ):
         super(SLR, self).__init__()
         
@@ -158,7 +268,8 @@ class SLR(nn.Module):
         self.n_keypoints = n_keypoints
 
         self.cls_token = nn.Parameter(torch.rand(1, 1, n_embd))
-        self.tokenizer = Tokenizer(n_embd, n_keypoints, max_len)
+        tokenizer_cls = FusedTokenizer if fused_tokenizer else Tokenizer
+        self.tokenizer = tokenizer_cls(n_embd, n_keypoints, max_len)
         self.pos_embd = nn.Embedding(max_len+n_keypoints, n_embd)
 
         self.blocks = nn.ModuleList([
@@ -173,6 +284,10 @@ class SLR(nn.Module):
         })
         self.default_name = next(iter(n_cls_dict))
 
+        # Optional early-exit classifiers, see add_early_exits
+        self.exits = nn.ModuleDict()
+        self.exit_head = self.default_name
+
         #self.word_proj = WordProjection(word_embd, n_embd)
         
         self.apply(self._init_weights)
@@ -189,18 +304,22 @@ class SLR(nn.Module):
         elif isinstance(module, nn.Embedding):
             torch.nn.init.normal_(module.weight, mean=0.0, std=0.01)
 
-    def forward(self, keypoints, valid_keypoints, dataset_name=None):
-        
-        batch_size = len(keypoints)
-        cls_token = self.cls_token.expand(batch_size, -1, -1)
-        
+    def embed(self, keypoints, valid_keypoints):
         tok_emb = self.tokenizer(keypoints, valid_keypoints)  # shape (B, T+n_keypoints, n_embd)
+        return self.embed_tokens(tok_emb)
+
+    def embed_tokens(self, tok_emb):
+        batch_size = tok_emb.size(0)
+        cls_token = self.cls_token.expand(batch_size, -1, -1)
         
-        
-        pos = torch.arange(0, tok_emb.size(1), dtype=torch.long, device=keypoints.device)
+        pos = torch.arange(0, tok_emb.size(1), dtype=torch.long, device=tok_emb.device)
         pos_emb = self.pos_embd(pos)
         
-        x = torch.cat([cls_token, tok_emb + pos_emb], dim=1)  # shape (B, T+n_keypoints+1, n_embd)
+        return torch.cat([cls_token, tok_emb + pos_emb], dim=1)  # shape (B, T+n_keypoints+1, n_embd)
+
+    def forward(self, keypoints, valid_keypoints, dataset_name=None):
+        
+        x = self.embed(keypoints, valid_keypoints)
         
         for block in self.blocks:
             x = block(x)
@@ -210,6 +329,65 @@ class SLR(nn.Module):
         output = x[:, 0]
         
         return output
+
+    def forward_windows(self, keypoints, valid_keypoints, indices):
+        """
+        Run several temporal windows of one video as a batch.
+        keypoints (N, n_keypoints, 3) and valid (N, n_keypoints) hold every
+        frame, indices (S, T) picks the frames of each window. Spatial tokens
+        are computed once per frame and gathered for each window; only the
+        temporal tokens are computed per window. Same output as forward on
+        keypoints[indices]
+        """
+        if not isinstance(self.tokenizer, FusedTokenizer):
+            return self(keypoints[indices], valid_keypoints[indices])
+
+        # One tokenizer entry point, so wrappers around it cover this path too
+        x = self.embed_tokens(self.tokenizer.window_tokens(keypoints, valid_keypoints, indices))
+
+        for block in self.blocks:
+            x = block(x)
+
+        x = self.layernorm(x)
+        return x[:, 0]
+
+    def add_early_exits(self, layers, head=None):
+        """
+        Attach exit classifiers after the given blocks (0-indexed, excluding
+        the last one). They start as copies of the final layernorm and head,
+        with an infinite threshold so they never fire until calibrated
+        """
+        self.exit_head = head or self.default_name
+        final_head = self.heads[self.exit_head]
+        self.exits = nn.ModuleDict()
+        for layer in layers:
+            if not 0 <= layer < len(self.blocks) - 1:
+                raise ValueError(f"Exit layer {layer} must be in [0, {len(self.blocks) - 1})")
+            exit_classifier = ExitClassifier(self.n_embd, final_head.out_features).to(final_head.weight.device)
+            exit_classifier.layernorm.load_state_dict(self.layernorm.state_dict())
+            exit_classifier.head.load_state_dict(final_head.state_dict())
+            self.exits[str(layer)] = exit_classifier
+
+    def forward_early_exit(self, keypoints, valid_keypoints):
+        """
+        Early-exit inference mode for the exit_head classifier. Runs the
+        blocks until an exit classifier's top-1 minus top-2 softmax margin of
+        the batch-averaged prediction passes its threshold, so a TTA batch
+        exits as a whole.
+        Returns logits (B, n_classes) and the number of blocks that ran
+        """
+        x = self.embed(keypoints, valid_keypoints)
+
+        for i, block in enumerate(self.blocks):
+            x = block(x)
+            if str(i) in self.exits:
+                exit_classifier = self.exits[str(i)]
+                logits = exit_classifier(x[:, 0])
+                if softmax_margin(logits) >= exit_classifier.threshold:
+                    return logits, i + 1
+
+        x = self.layernorm(x[:, 0])
+        return self.heads[self.exit_head](x), len(self.blocks)
     
     def num_params(self):
         return sum(p.numel() for p in self.parameters() if p.requires_grad)
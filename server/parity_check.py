@@ -0,0 +1,125 @@
+"""
+Compare reduced-precision SLR inference against the fp32 model.
+
+Reports top-1 agreement and top-5 overlap with the fp32 predictions, weight
+size and model latency for every precision mode, on the clips in test_videos
+and/or on stored keypoint files (same split csv + .npz layout as VideoDataset).
+
+    python parity_check.py --modes int8 bf16
+    python parity_check.py --split val.csv --keypoints-path keypoints/ --no-videos
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+
+from inference import PRECISIONS, SLRClassifier, build_model, weight_bytes
+from tta import build_tta_batch, run_tta
+from VideoDataset import get_selected_keypoints
+
+
+def load_video_poses(video_dir):
+    """Extract (name, pose, height, width) for every clip, the same way the server does"""
+    # MediaPipe is only needed when running on raw videos
+    from VideoLoader import KeypointExtractor, flip_frames, read_video
+
+    extractor = KeypointExtractor()
+    samples = []
+    for name in sorted(os.listdir(video_dir)):
+        if not name.endswith('.mp4'):
+            continue
+        video = read_video(os.path.join(video_dir, name))
+        if video is None:
+            continue
+        video = flip_frames(video)
+        height, width = video.shape[1], video.shape[2]
+        pose = extractor.extract_safe_parallel(video)
+        samples.append((name, pose, height, width))
+        del video
+    return samples
+
+
+def load_keypoint_files(split, keypoints_path):
+    """Load (name, pose, height, width) from a VideoDataset split csv"""
+    split = pd.read_csv(split)
+    samples = []
+    for i in range(len(split)):
+        name, _ = os.path.splitext(split['file'][i])
+        pose = np.load(os.path.join(keypoints_path, name + '.npz'))['keypoints']
+        samples.append((name, torch.from_numpy(pose), split['height'][i], split['width'][i]))
+    return samples
+
+
+def predict(model, samples, sample_amount, seed):
+    """Averaged TTA logits per sample plus total model time"""
+    classifier = SLRClassifier(model).eval()
+    all_logits = []
+    elapsed = 0.0
+    for i, (name, pose, height, width) in enumerate(samples):
+        keypoints, valid_keypoints = build_tta_batch(
+            pose, get_selected_keypoints(), sample_amount,
+            height=height, width=width, seed=seed + i
+        )
+        start = time.perf_counter()
+        all_logits.append(run_tta(classifier, keypoints, valid_keypoints))
+        elapsed += time.perf_counter() - start
+    return torch.stack(all_logits), elapsed
+
+
+def compare(reference, candidate):
+    ref_top5 = reference.topk(5, dim=-1).indices
+    cand_top5 = candidate.topk(5, dim=-1).indices
+    top1 = (ref_top5[:, 0] == cand_top5[:, 0]).float().mean().item()
+    top1_in_top5 = (ref_top5[:, :1] == cand_top5).any(dim=-1).float().mean().item()
+    overlap = torch.tensor([
+        len(set(r.tolist()) & set(c.tolist())) / 5 for r, c in zip(ref_top5, cand_top5)
+    ]).mean().item()
+    return top1, top1_in_top5, overlap
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checkpoint', default='./models/big_model.pth')
+    parser.add_argument('--modes', nargs='+', default=['int8', 'bf16'], choices=PRECISIONS)
+    parser.add_argument('--videos', default='./test_videos')
+    parser.add_argument('--no-videos', action='store_true')
+    parser.add_argument('--split', help='VideoDataset split csv (file, width, height, idx)')
+    parser.add_argument('--keypoints-path', help='directory with the .npz keypoint files')
+    parser.add_argument('--samples', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    samples = []
+    if not args.no_videos:
+        samples += load_video_poses(args.videos)
+    if args.split:
+        samples += load_keypoint_files(args.split, args.keypoints_path)
+    if not samples:
+        parser.error("no videos or keypoint files to evaluate")
+
+    print(f"Evaluating {len(samples)} samples with {args.samples} TTA samples each")
+
+    reference = build_model(args.checkpoint, precision='fp32')
+    ref_logits, ref_time = predict(reference, samples, args.samples, args.seed)
+    ref_bytes = weight_bytes(reference)
+    del reference
+
+    print(f"{'mode':<6} {'top1 agree':>10} {'top1 in top5':>13} {'top5 overlap':>13} {'weights MB':>11} {'time s':>8}")
+    print(f"{'fp32':<6} {1:>10.3f} {1:>13.3f} {1:>13.3f} {ref_bytes / 1024**2:>11.0f} {ref_time:>8.2f}")
+
+    for mode in args.modes:
+        if mode == 'fp32':
+            continue
+        model = build_model(args.checkpoint, precision=mode)
+        logits, elapsed = predict(model, samples, args.samples, args.seed)
+        top1, top1_in_top5, overlap = compare(ref_logits, logits)
+        print(f"{mode:<6} {top1:>10.3f} {top1_in_top5:>13.3f} {overlap:>13.3f} "
+              f"{weight_bytes(model) / 1024**2:>11.0f} {elapsed:>8.2f}")
+        del model
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Check that FusedTokenizer is a drop-in replacement for the looped Tokenizer.
+
+Runs both on the same weights and random keypoints, with a share of the
+keypoints missing (-1, valid=False), for full (T=64) and shorter windows,
+and compares the tokens and the SLR outputs. Then checks that the
+multi-window path (forward_windows) matches forward on the same windows in
+fp32 and bf16, with its tokens equal to the fp32 ones. Exits non-zero if
+any difference is above --tolerance.
+
+    python tokenizer_parity.py
+    python tokenizer_parity.py --checkpoint ./models/big_model.pth --lengths 64 32 8
+"""
+import argparse
+import copy
+import sys
+
+import torch
+
+from inference import apply_precision, precision_context
+from model import SLR, FusedTokenizer, Tokenizer
+from tta import window_indices
+
+
+def random_batch(batch_size, length, n_keypoints, missing, generator):
+    """Keypoints (B, T, K, 3) in [0, 1] with `missing` of them set to -1, and the valid mask"""
+    keypoints = torch.rand(batch_size, length, n_keypoints, 3, generator=generator)
+    valid = torch.rand(batch_size, length, n_keypoints, generator=generator) >= missing
+    keypoints[~valid] = -1
+    return keypoints, valid
+
+
+def load_models(checkpoint):
+    """The same weights in an SLR with the fused and one with the looped tokenizer"""
+    fused = SLR(fused_tokenizer=True)
+    if checkpoint:
+        from inference import build_model
+
+        fused = build_model(checkpoint, precision='fp32')
+    looped = copy.deepcopy(fused)
+    looped.tokenizer = Tokenizer(fused.n_embd, fused.n_keypoints, fused.max_len)
+    looped.tokenizer.load_state_dict(fused.tokenizer.state_dict())
+    return fused.eval(), looped.eval()
+
+
+def window_diffs(model, precision, keypoints, valid, indices):
+    """
+    Max differences between forward_windows and forward on the same windows,
+    for the tokens (also against fp32 tokens) and the outputs
+    """
+    with torch.no_grad():
+        reference_tokens = model.tokenizer(keypoints[indices], valid[indices])
+        model = apply_precision(copy.deepcopy(model), precision)
+        with precision_context(model):
+            window_tokens = model.tokenizer.window_tokens(keypoints, valid, indices)
+            tokens = model.tokenizer(keypoints[indices], valid[indices])
+            window_output = model.forward_windows(keypoints, valid, indices)
+            output = model(keypoints[indices], valid[indices])
+    return (
+        (window_tokens.float() - tokens.float()).abs().max().item(),
+        (window_tokens.float() - reference_tokens).abs().max().item(),
+        (window_output.float() - output.float()).abs().max().item(),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checkpoint', help='compare on these weights instead of a random init')
+    parser.add_argument('--lengths', nargs='+', type=int, default=[64, 40, 17])
+    parser.add_argument('--batch-size', type=int, default=4)
+    parser.add_argument('--missing', type=float, default=0.3, help='share of keypoints set to -1')
+    parser.add_argument('--tolerance', type=float, default=1e-4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--clip-length', type=int, default=150, help='frames of the clip for the window check')
+    args = parser.parse_args()
+
+    torch.manual_seed(args.seed)
+    fused, looped = load_models(args.checkpoint)
+    assert isinstance(fused.tokenizer, FusedTokenizer) and type(looped.tokenizer) is Tokenizer
+
+    generator = torch.Generator().manual_seed(args.seed)
+    failed = False
+    print(f"{'T':>3} {'tokens':>10} {'output':>10}")
+    with torch.no_grad():
+        for length in args.lengths:
+            keypoints, valid = random_batch(args.batch_size, length, fused.n_keypoints, args.missing, generator)
+            token_diff = (fused.tokenizer(keypoints, valid) - looped.tokenizer(keypoints, valid)).abs().max().item()
+            output_diff = (fused(keypoints, valid) - looped(keypoints, valid)).abs().max().item()
+            failed |= max(token_diff, output_diff) > args.tolerance
+            print(f"{length:>3} {token_diff:>10.2e} {output_diff:>10.2e}")
+
+    keypoints, valid = random_batch(1, args.clip_length, fused.n_keypoints, args.missing, generator)
+    indices = window_indices(args.clip_length, fused.max_len, 4)
+    print(f"{'windows':>7} {'tokens':>10} {'vs fp32':>10} {'output':>10}")
+    for precision in ('fp32', 'bf16'):
+        diffs = window_diffs(fused, precision, keypoints[0], valid[0], indices)
+        failed |= max(diffs) > args.tolerance
+        print(f"{precision:>7} {diffs[0]:>10.2e} {diffs[1]:>10.2e} {diffs[2]:>10.2e}")
+
+    if failed:
+        print(f"FAILED: difference above {args.tolerance}")
+        sys.exit(1)
+    print("FusedTokenizer matches Tokenizer")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import random
+from contextlib import contextmanager
+
+import torch
+
+from VideoDataset import process_keypoints, sample_indices
+
+
+@contextmanager
+def seeded(seed=None):
+    """
+    Seed the python and torch RNGs used by the augmentations for the duration
+    of the block, restoring the previous global state afterwards
+    """
+    if seed is None:
+        yield
+        return
+
+    py_state = random.getstate()
+    with torch.random.fork_rng(devices=[]):
+        random.seed(seed)
+        torch.manual_seed(seed)
+        try:
+            yield
+        finally:
+            random.setstate(py_state)
+
+
+def tta_indices(length, sample_amount, target_length=64, seed=None):
+    """
+    Frame indices of every augmented sample, drawn before any keypoints
+    exist so extraction can be limited to them. (S, target_length)
+    """
+    with seeded(seed):
+        return torch.stack([
+            sample_indices(length, target_length, augment=True) for _ in range(sample_amount)
+        ]).long()
+
+
+def frames_needed(indices, context=0):
+    """
+    Sorted frames read by a set of index rows, each preceded by `context`
+    earlier frames so the MediaPipe trackers have history to follow
+    """
+    frames = torch.unique(torch.as_tensor(indices).flatten())
+    if context > 0:
+        frames = torch.unique((frames.view(-1, 1) - torch.arange(context + 1)).clamp(min=0))
+    return frames.tolist()
+
+
+def build_tta_batch(pose, selected_keypoints, sample_amount, height, width,
+                    target_length=64, seed=None, indices=None):
+    """
+    Build all augmented samples up front. `indices` (S, target_length) fixes
+    the frames of each sample, as drawn by tta_indices(); by default they
+    are sampled here.
+    Returns keypoints (S, target_length, K, 3) and valid (S, target_length, K),
+    or (None, None) if no sample had any keypoints
+    """
+    keypoints_list = []
+    valid_keypoints_list = []
+
+    with seeded(seed):
+        for i in range(sample_amount):
+            keypoints, valid_keypoints = process_keypoints(
+                pose, target_length, selected_keypoints,
+                height=height, width=width, augment=True,
+                indices=None if indices is None else indices[i]
+            )
+            if keypoints.numel() == 0:
+                continue
+            keypoints_list.append(keypoints)
+            valid_keypoints_list.append(valid_keypoints)
+
+    if not keypoints_list:
+        return None, None
+
+    return torch.stack(keypoints_list), torch.stack(valid_keypoints_list)
+
+
+def run_tta(classifier, keypoints, valid_keypoints):
+    """
+    Run a stacked TTA batch through a classifier (backbone + one head) in one
+    forward pass. Returns the logits averaged over samples, shape (n_classes,)
+    """
+    with torch.no_grad():
+        logits = classifier(keypoints, valid_keypoints)
+    return logits.mean(dim=0)
+
+
+async def run_adaptive_tta(submit, keypoints, valid_keypoints, min_samples=4, step=4, tolerance=0.02):
+    """
+    Sequential early stopping over a pre-built TTA batch. Samples are sent
+    to `submit` (async, returns per-sample logits) `step` at a time, and
+    drawing stops once at least `min_samples` have run and two consecutive
+    running averages agree on the top-1 class with a top-1 minus top-2
+    softmax margin within `tolerance`.
+    Returns the averaged logits and the number of samples used
+    """
+    total = None
+    used = 0
+    previous = None
+    while used < len(keypoints):
+        logits = await submit(keypoints[used:used + step], valid_keypoints[used:used + step])
+        total = logits.sum(dim=0) if total is None else total + logits.sum(dim=0)
+        used += len(logits)
+
+        top2 = torch.softmax(total / used, dim=-1).topk(2)
+        current = (top2.indices[0].item(), (top2.values[0] - top2.values[1]).item())
+        if (used >= min_samples and previous is not None and current[0] == previous[0]
+                and abs(current[1] - previous[1]) <= tolerance):
+            break
+        previous = current
+
+    return total / used, used
+
+
+def spread(low, high, n):
+    """n evenly spaced points from low to high, or the midpoint when n is 1"""
+    if n == 1:
+        return torch.tensor([(low + high) / 2])
+    return torch.linspace(low, high, n)
+
+
+def window_indices(length, target_length, n_windows):
+    """
+    Deterministic counterpart of sample_indices(augment=True): n_windows
+    evenly spread windows over the clip instead of random ones. Long clips
+    get evenly spaced start frames, short clips get evenly spaced shifts of
+    the stretched window. A single window is centered. Duplicate windows are
+    dropped. Returns (S, target_length)
+    """
+    windows = []
+    if length > target_length:
+        for start in spread(0, length - target_length, n_windows).round().int().tolist():
+            windows.append(torch.arange(start, start + target_length))
+    else:
+        base = torch.linspace(0, length - 1, target_length).int()
+        for shift in spread(-10, 10, n_windows).round().int().tolist():
+            windows.append(torch.clamp(base + shift, 0, length - 1))
+
+    return torch.unique(torch.stack(windows).long(), dim=0)
+
+
+def build_window_batch(pose, selected_keypoints, n_windows, height, width, target_length=64, indices=None):
+    """
+    Normalized keypoints for every frame, (N, K, 3) and (N, K), plus the
+    frame indices of each window, (S, target_length)
+    """
+    keypoints = torch.as_tensor(pose)[:, selected_keypoints, :]
+    valid_keypoints = torch.all(keypoints != -1, dim=-1)
+    keypoints = keypoints * torch.tensor([1/width, 1/height, 1], dtype=keypoints.dtype)
+    if indices is None:
+        indices = window_indices(len(keypoints), target_length, n_windows)
+    return keypoints, valid_keypoints, indices
+
+
+def run_windows(classifier, keypoints, valid_keypoints, indices):
+    """
+    Multi-window inference that shares the per-frame spatial tokens between
+    windows when the classifier supports it. Returns the averaged logits
+    """
+    with torch.no_grad():
+        if hasattr(classifier, 'forward_windows'):
+            logits = classifier.forward_windows(keypoints, valid_keypoints, indices)
+        else:
+            logits = classifier(keypoints[indices], valid_keypoints[indices])
+    return logits.mean(dim=0)